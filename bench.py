@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+# Rough benchmarks of the AST: memory held by a parsed makefile and the
+# speed of evaluating it.
+#
+# usage: bench.py [count]
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import tracemalloc
+import contextlib
+
+logger = logging.getLogger("pymake.bench")
+
+import pymake
+import symbol
+from symbol import Literal, VarRef, Expression
+from vline import VCharString
+from symtable import SymbolTable
+
+def make_src(count):
+	# synthetic makefile; lots of small assignments and rules
+	lines = []
+	for n in range(count):
+		lines.append("SRC{0} = src/foo{0}.c $(SRCDIR)/bar{0}.c\n".format(n))
+		lines.append("OBJ{0} := $(CC) $(CFLAGS) -c foo{0}.c -o foo{0}.o\n".format(n))
+		lines.append("foo{0}.o : foo{0}.c foo{0}.h $(HDRS)\n".format(n))
+	return "".join(lines)
+
+def parse_src(s):
+	with tempfile.NamedTemporaryFile("w", suffix=".mk", delete=False) as outfile:
+		outfile.write(s)
+	try:
+		# the tokenizer is very chatty
+		with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+			return pymake.parse_makefile(outfile.name)
+	finally:
+		os.unlink(outfile.name)
+
+def bench_memory(count):
+	s = make_src(count)
+
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	makefile = parse_src(s)
+	after = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+
+	print("memory: {0} statements {1:.1f} KiB ({2:.0f} bytes/statement)".format(
+			len(makefile.token_list), (after-before)/1024, (after-before)/len(makefile.token_list)))
+	return makefile
+
+def bench_construct(count):
+	# build the same tree with and without AST validation
+	# $(CC) $(CFLAGS) -c $(SRC$(DIR))/foo.c -o $(OBJDIR)/foo.o
+	def vcs(s):
+		return VCharString.from_string(s)
+
+	def build():
+		return Expression([VarRef([Literal(vcs("CC"))]),
+						   Literal(vcs(" ")),
+						   VarRef([Literal(vcs("CFLAGS"))]),
+						   Literal(vcs(" -c ")),
+						   VarRef([Literal(vcs("SRC")), VarRef([Literal(vcs("DIR"))])]),
+						   Literal(vcs("/foo.c -o ")),
+						   VarRef([Literal(vcs("OBJDIR"))]),
+						   Literal(vcs("/foo.o")),
+						  ])
+
+	save = symbol.checked
+	try:
+		for flag in (True, False):
+			symbol.checked = flag
+			start = time.perf_counter()
+			for i in range(count):
+				build()
+			elapsed = time.perf_counter() - start
+			print("construct: checked={0} {1} trees {2:.3f}s".format(flag, count, elapsed))
+	finally:
+		symbol.checked = save
+
+def bench_hashcons(count):
+	# memory given back by sharing identical subtrees
+	from hashcons import HashConsTable
+
+	tracemalloc.start()
+	makefile = parse_src(make_src(count))
+	before = tracemalloc.get_traced_memory()[0]
+	table = HashConsTable()
+	table.intern_makefile(makefile)
+	after = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+
+	print("hashcons: {0} shared nodes {1:.1f} KiB -> {2:.1f} KiB".format(
+			table.hits, before/1024, after/1024))
+
+def bench_eval(makefile, loops):
+	symtable = SymbolTable()
+	assignments = [tok for tok in makefile.token_list if isinstance(tok, pymake.AssignmentExpression)]
+
+	start = time.perf_counter()
+	for i in range(loops):
+		for tok in assignments:
+			tok.eval(symtable)
+	elapsed = time.perf_counter() - start
+
+	print("eval: {0} assignments x {1} loops {2:.3f}s".format(len(assignments), loops, elapsed))
+
+def bench_expand(loops):
+	# expand a recursively expanded variable over and over
+	# CFLAGS = $(OPT) $(WARN) -I$(SRC$(ARCH))/include
+	def vcs(s):
+		return VCharString.from_string(s)
+
+	symtable = SymbolTable()
+	symtable.add("OPT", "-O2")
+	symtable.add("WARN", "-Wall")
+	symtable.add("ARCH", "x86")
+	symtable.add("SRCx86", "arch/x86")
+	symtable.add("CFLAGS", Expression([VarRef([Literal(vcs("OPT"))]),
+									   Literal(vcs(" ")),
+									   VarRef([Literal(vcs("WARN"))]),
+									   Literal(vcs(" -I")),
+									   VarRef([Literal(vcs("SRC")), VarRef([Literal(vcs("ARCH"))])]),
+									   Literal(vcs("/include")),
+									  ]))
+	ref = VarRef([Literal(vcs("CFLAGS"))])
+
+	# the symbol table logs every fetch
+	save = logging.getLogger("pymake.symtable").level
+	logging.getLogger("pymake.symtable").setLevel(logging.INFO)
+	try:
+		start = time.perf_counter()
+		for i in range(loops):
+			ref.eval(symtable)
+		elapsed = time.perf_counter() - start
+	finally:
+		logging.getLogger("pymake.symtable").setLevel(save)
+
+	print("expand: {0} loops {1:.3f}s".format(loops, elapsed))
+
+def bench_append(loops):
+	# OBJS := ... then OBJS += file.o over and over, reading it at the end
+	def vcs(s):
+		return VCharString.from_string(s)
+
+	symtable = SymbolTable()
+	symtable.add("OBJS", "main.o")
+	rhs = Expression([Literal(vcs("file.o"))])
+
+	save = logging.getLogger("pymake.symtable").level
+	logging.getLogger("pymake.symtable").setLevel(logging.INFO)
+	try:
+		start = time.perf_counter()
+		for i in range(loops):
+			symtable.append("OBJS", rhs)
+		symtable.expand("OBJS")
+		elapsed = time.perf_counter() - start
+	finally:
+		logging.getLogger("pymake.symtable").setLevel(save)
+
+	print("append: {0} loops {1:.3f}s".format(loops, elapsed))
+
+def bench_call(loops):
+	# $(call template,$m) with a different argument every time
+	# template = $(1)_OBJS := $(1).o $(OPT)
+	def vcs(s):
+		return VCharString.from_string(s)
+
+	symtable = SymbolTable()
+	symtable.add("OPT", "-O2")
+	symtable.add("template", Expression([VarRef([Literal(vcs("1"))]),
+										 Literal(vcs("_OBJS := ")),
+										 VarRef([Literal(vcs("1"))]),
+										 Literal(vcs(".o ")),
+										 VarRef([Literal(vcs("OPT"))]),
+										]))
+	args = ["mod%d" % i for i in range(100)]
+
+	save = logging.getLogger("pymake.symtable").level
+	logging.getLogger("pymake.symtable").setLevel(logging.INFO)
+	try:
+		start = time.perf_counter()
+		for i in range(loops):
+			symtable.call("template", [args[i % 100]])
+		elapsed = time.perf_counter() - start
+	finally:
+		logging.getLogger("pymake.symtable").setLevel(save)
+
+	print("call: {0} loops {1:.3f}s".format(loops, elapsed))
+
+def main():
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+	bench_construct(count*20)
+	makefile = bench_memory(count)
+	bench_eval(makefile, 20)
+	bench_expand(count*200)
+	bench_append(count*200)
+	bench_call(count*200)
+	bench_hashcons(count)
+
+if __name__=='__main__':
+	main()
@@ -0,0 +1,144 @@
+# Persistent parse cache. Like .pyc files but for makefiles.
+#
+# A parsed Makefile is stored on disk keyed by a hash of the source content,
+# the source filename, the pymake version and the GNU Make version we're
+# emulating (Version.major/minor change how the tokenizer behaves).
+#
+# A second, small record per source path remembers the mtime/size of the file
+# when it was last hashed so a warm start doesn't even need to read the file.
+#
+# cache_dir/
+#	<path key>.stat   json {path, mtime_ns, size, key}
+#	<content key>.ast  serialized Makefile (see serialize.py)
+#
+# Entries are loaded with serialize.loads() so LineBlocks and RecipeLists
+# aren't even decoded until something touches them.
+#
+# pymake.py only uses the cache when $PYMAKE_CACHE is set.
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger("pymake.cache")
+
+from version import Version, pymake_version
+import serialize
+
+__all__ = [ "ParseCache",
+			"default_cache_dir",
+		  ]
+
+# bump when the on-disk layout (not the AST) changes
+cache_format = 2
+
+def default_cache_dir():
+	# $PYMAKE_CACHE_DIR wins, otherwise follow XDG
+	cache_dir = os.getenv("PYMAKE_CACHE_DIR")
+	if cache_dir:
+		return cache_dir
+	xdg = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+	return os.path.join(xdg, "pymake")
+
+def dialect():
+	# everything besides the source that changes the shape of the AST (the
+	# schema includes the python version and hash width; the stored
+	# structural hashes are python tuple hashes)
+	return "pymake={0} make={1}.{2} format={3}.{4} schema={5}".format(
+				pymake_version, Version.major, Version.minor, cache_format,
+				serialize.format_version, serialize.schema())
+
+class ParseCache(object):
+	def __init__(self, cache_dir=None):
+		self.cache_dir = cache_dir if cache_dir else default_cache_dir()
+
+	def _path(self, key, suffix):
+		return os.path.join(self.cache_dir, key + suffix)
+
+	def write(self, path, data):
+		# Write data to path through a temp file in the same directory then
+		# rename so a concurrent reader never sees a partial entry. Also
+		# used for other persistent indexes (see xref.py).
+		dirname = os.path.dirname(path) or "."
+		os.makedirs(dirname, exist_ok=True)
+		fd, tmpname = tempfile.mkstemp(dir=dirname, prefix=".tmp")
+		try:
+			with os.fdopen(fd, "wb") as outfile:
+				outfile.write(data)
+			os.replace(tmpname, path)
+		except:
+			os.unlink(tmpname)
+			raise
+
+	def path_key(self, filename):
+		s = os.path.abspath(filename) + "\0" + dialect()
+		return hashlib.sha1(s.encode("utf8")).hexdigest()
+
+	def content_key(self, filename, content):
+		# filename is part of the key because every VChar in the AST knows its
+		# filename
+		h = hashlib.sha1(dialect().encode("utf8"))
+		h.update(b"\0")
+		h.update(filename.encode("utf8"))
+		h.update(b"\0")
+		h.update(content)
+		return h.hexdigest()
+
+	def _stat_key(self, filename, st):
+		# Cheap check: if the mtime/size match what we saw last time, reuse the
+		# content key without reading the file.
+		try:
+			with open(self._path(self.path_key(filename), ".stat"), "r") as infile:
+				record = json.load(infile)
+		except (OSError, ValueError):
+			return None
+
+		if record.get("mtime_ns") == st.st_mtime_ns and record.get("size") == st.st_size:
+			return record.get("key")
+		return None
+
+	def file_key(self, filename):
+		# content key of a file, skipping the read+hash if the file's
+		# mtime/size haven't changed since last time
+		st = os.stat(filename)
+
+		key = self._stat_key(filename, st)
+		if key is None:
+			with open(filename, "rb") as infile:
+				content = infile.read()
+			key = self.content_key(filename, content)
+			self._store_stat(filename, st, key)
+		return key
+
+	def lookup(self, filename):
+		# Returns (makefile, key). makefile is None on a cache miss; the key
+		# is then passed back to store() after the caller parses the file.
+		key = self.file_key(filename)
+
+		try:
+			with open(self._path(key, ".ast"), "rb") as infile:
+				makefile = serialize.load(infile)
+		except FileNotFoundError:
+			logger.debug("cache miss filename=%s key=%s", filename, key)
+			return None, key
+		except Exception as err:
+			# stale or corrupt entry; treat as a miss and let store() replace it
+			logger.warning("bad cache entry filename=%s key=%s err=%s", filename, key, err)
+			return None, key
+
+		logger.debug("cache hit filename=%s key=%s", filename, key)
+		return makefile, key
+
+	def store(self, filename, key, makefile):
+		logger.debug("cache store filename=%s key=%s", filename, key)
+		data = serialize.dumps(makefile)
+		self.write(self._path(key, ".ast"), data)
+
+	def _store_stat(self, filename, st, key):
+		record = { "path" : os.path.abspath(filename),
+				   "mtime_ns" : st.st_mtime_ns,
+				   "size" : st.st_size,
+				   "key" : key }
+		self.write(self._path(self.path_key(filename), ".stat"), json.dumps(record).encode("utf8"))
@@ -6,6 +6,7 @@ __all__ = [ "MakeError",
 			"Unimplemented",
 			"VersionError",
 			"EvalError",
+			"RecursiveVariable",
 		  ]
 
 # test/debug flags
@@ -53,3 +54,11 @@ class VersionError(MakeError):
 class EvalError(MakeError):
 	"""execution error e.g., bad function call"""
 	pass
+
+class RecursiveVariable(EvalError):
+	"""recursively expanded variable references itself"""
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		# [ (name, filename, pos), ... ] from the variable through the
+		# variables it references back to itself
+		self.chain = kwargs.get("chain", [])
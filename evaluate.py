@@ -8,10 +8,16 @@ import logging
 logger = logging.getLogger("pymake.evaluate")
 
 def evaluate(symbol_list, symbol_table):
-	s = ""
+	# Gather the chunks and join once. Expressions hand their chunks up
+	# through their emitter (see Symbol.compile()) instead of building
+	# intermediate strings.
+	out = []
 	for sym in symbol_list:
-		logger.debug("sym=%s", sym)
-		s += sym.eval(symbol_table)
-		logger.debug("eval result s=\"%s\"", s)
-		logger.debug("symbol_table=%s", symbol_table)
+		emitter = getattr(sym, "emitter", None)
+		if emitter is None:
+			out.append(sym.eval(symbol_table))
+		else:
+			emitter()(symbol_table, out)
+	s = "".join(out)
+	logger.debug("eval result s=\"%s\"", s)
 	return s
@@ -3,12 +3,15 @@
 
 import sys
 import logging
+import collections
 
 logger = logging.getLogger("pymake.functions")
 logger.setLevel(level=logging.DEBUG)
 
-from symbol import VarRef, Literal
+from symbol import VarRef, Literal, Expression
 from evaluate import evaluate
+from wordlist import WordList, iter_words
+from pattern import compile_patterns
 from vline import VCharString, whitespace
 from error import *
 import shell
@@ -17,6 +20,13 @@ __all__ = [ "Info",
 			"MWarning",
 			"Error",
 			"Shell", 
+			"Eval",
+			"Call",
+			"Foreach",
+			"Sort",
+			"Filter",
+			"FilterOut",
+			"Wordlist",
 
 			"make_function",
 		  ]
@@ -62,22 +72,43 @@ builtins = {
 }
 
 class Function(VarRef):
+	__slots__ = ()
+
+	# True if the result depends only on the arguments (no symbol table, no
+	# side effects); optimize.py folds pure functions of constants
+	pure = False
+
 	def __init__(self, args):
 		logger.debug("function=%s args=%s", self.name, args)
 		super().__init__(args)
 
-	def makefile(self):
-		s = "$(" + self.name + " "
+	def fragments(self):
+		yield "$(" + self.name + " "
 		for t in self.token_list : 
-			s += t.makefile()
-		s += ")"
-		return s
+			yield from t.fragments()
+		yield ")"
 
 	def eval(self, symbol_table):
 		return ""
 
+	def wordlist(self, symbol_table):
+		# the result as a WordList; text functions override to skip the
+		# string
+		return WordList.from_string(self.eval(symbol_table))
+
+def arg_words(tokens, symbol_table):
+	# The WordList of an argument. An argument that's just another function
+	# call (surrounding whitespace aside) hands over its WordList directly.
+	calls = [t for t in tokens if not (isinstance(t, Literal) and not t.eval(None).strip())]
+	if len(calls)==1 and isinstance(calls[0], Function):
+		return calls[0].wordlist(symbol_table)
+	return WordList.from_string(evaluate(tokens, symbol_table))
+
 class PrintingFunction(Function):
+	__slots__ = ()
+
 	def eval(self, symbol_table):
+		symbol_table.impure()
 		s = evaluate(self.token_list, symbol_table)
 		logger.debug("%s \"%s\"", self.name, s)
 		print(s, file=self.fh)
@@ -85,15 +116,18 @@ class PrintingFunction(Function):
 
 class Info(PrintingFunction):
 	name = "info"
+	__slots__ = ()
 	fh = sys.stdout
 
 class MWarning(PrintingFunction):
 	# name Warning is used by Python builtins so use MWarning instead
 	name = "warning"
+	__slots__ = ()
 	fh = sys.stderr
 
 	def eval(self, symbol_table):
 		logger.debug("self=%s", self)
+		symbol_table.impure()
 		t = self.token_list[0]
 		s = evaluate(self.token_list, symbol_table)
 		print("{}:{}: {}".format(t.string[0].filename, t.string[0].linenumber, s), file=self.fh)
@@ -101,10 +135,12 @@ class MWarning(PrintingFunction):
 
 class Error(PrintingFunction):
 	name = "error"
+	__slots__ = ()
 	fh = sys.stderr
 
 	def eval(self, symbol_table):
 		logger.debug("self=%s", self)
+		symbol_table.impure()
 
 		t = self.token_list[0]
 
@@ -114,29 +150,44 @@ class Error(PrintingFunction):
 
 class Words(Function):
 	name = "words"
+	__slots__ = ()
+	pure = True
 	def eval(self, symbol_table):
-		s = evaluate(self.token_list, symbol_table)
-		return str(len(s.split()))
+		return str(len(arg_words(self.token_list, symbol_table)))
 
 class FirstWord(Function):
 	name = "firstword"
+	__slots__ = ()
+	pure = True
 	def eval(self, symbol_table):
-		s = evaluate(self.token_list, symbol_table)
-		try:
-			return s.split()[0]
-		except IndexError:
-			return ""
+		words = arg_words(self.token_list, symbol_table)
+		return words[0] if len(words) else ""
 
 class LastWord(Function):
 	name = "lastword"
+	__slots__ = ()
+	pure = True
 	def eval(self, symbol_table):
-		s = evaluate(self.token_list, symbol_table)
-		try:
-			return s.split()[-1]
-		except IndexError:
-			return ""
+		words = arg_words(self.token_list, symbol_table)
+		return words[-1] if len(words) else ""
+
+class Sort(Function):
+	# sorted, duplicates removed
+	name = "sort"
+	__slots__ = ()
+	pure = True
+
+	def wordlist(self, symbol_table):
+		words = arg_words(self.token_list, symbol_table)
+		return WordList(sorted(set(words.words())))
+
+	def eval(self, symbol_table):
+		return str(self.wordlist(symbol_table))
 
 class FunctionWithArguments(Function):
+	# num_args=None splits at every comma (e.g., $(call))
+	__slots__ = ("args",)
+
 	def __init__(self, token_list):
 		super().__init__(token_list)
 		self.args = []
@@ -147,7 +198,10 @@ class FunctionWithArguments(Function):
 		logger.debug("parse_args \"%s\"", self.name)
 
 		arg_idx = 0
-		self.args = [[] for n in range(self.num_args)]
+		if self.num_args is None:
+			self.args = [[]]
+		else:
+			self.args = [[] for n in range(self.num_args)]
 
 		for t in self.token_list:
 			print(t)
@@ -157,10 +211,12 @@ class FunctionWithArguments(Function):
 		# Split the Literal into new Literals around the commas.
 		# Preserve everything else as-is.
 		token_iter = iter(self.token_list)
+		leading = True
 		for t in token_iter:
 			if not isinstance(t, Literal):
 				# no touchy
 				self.args[arg_idx].append(t)
+				leading = False
 				continue
 
 			# peek inside the literal for commas 
@@ -170,10 +226,11 @@ class FunctionWithArguments(Function):
 				# looking for commas separating the args
 				if vchar.char != ',':
 					# consume leading whitespace
-					if arg_idx == 0 and vchar.char in whitespace:
+					if leading and vchar.char in whitespace:
 						pass
 					else:
 						lit.append(vchar)
+						leading = False
 					continue
 
 				logger.debug("found comma idx=%d", arg_idx)
@@ -182,6 +239,8 @@ class FunctionWithArguments(Function):
 					self.args[arg_idx].append(Literal(VCharString(lit)))
 					lit = []
 				arg_idx += 1
+				if self.num_args is None:
+					self.args.append([])
 
 				if arg_idx+1 == self.num_args:
 					# Done. Have everything we need.
@@ -191,19 +250,28 @@ class FunctionWithArguments(Function):
 					# consume the rest of the token stream
 					self.args[arg_idx].extend(list(token_iter))
 
+			if lit:
+				# text after the last comma in this literal
+				self.args[arg_idx].append(Literal(VCharString(lit)))
+
 		for arg in self.args:
 			for field in arg:
 				print(field)
 
-		if arg_idx+1 != self.num_args:
+		if self.num_args is not None and arg_idx+1 != self.num_args:
 			# TODO better error
 			errmsg = "found args=%d but needed=%d" % (arg_idx, self.num_args)
 			logger.error(errmsg)
 			raise ParseError(errmsg)
 
+		# args aren't modified after parsing
+		self.args = tuple(tuple(arg) for arg in self.args)
+
 
 class Subst(FunctionWithArguments):
 	name = "subst"
+	__slots__ = ()
+	pure = True
 	num_args = 3
 
 	def eval(self, symbol_table):
@@ -223,37 +291,200 @@ class Subst(FunctionWithArguments):
 
 		return s
 
+class Filter(FunctionWithArguments):
+	# $(filter pattern...,text) the words of text matching any pattern
+	name = "filter"
+	__slots__ = ()
+	pure = True
+	num_args = 2
+
+	def wordlist(self, symbol_table):
+		patterns = arg_words(self.args[0], symbol_table)
+		index = compile_patterns(patterns.words())
+		words = arg_words(self.args[1], symbol_table)
+		return WordList(index.filter(words.words()))
+
+	def eval(self, symbol_table):
+		return str(self.wordlist(symbol_table))
+
+class FilterOut(Filter):
+	# $(filter-out pattern...,text) the words of text matching no pattern
+	name = "filter-out"
+	__slots__ = ()
+
+	def wordlist(self, symbol_table):
+		patterns = arg_words(self.args[0], symbol_table)
+		index = compile_patterns(patterns.words())
+		words = arg_words(self.args[1], symbol_table)
+		return WordList(index.filter_out(words.words()))
+
+def _number_arg(fn, which, tokens, symbol_table):
+	# an integer argument of function fn; which is "first", "second", ...
+	n_s = evaluate(tokens, symbol_table).strip()
+	try:
+		return int(n_s)
+	except ValueError:
+		errmsg = "non-numeric {0} argument to '{1}' function: '{2}'".format(which, fn.name, n_s)
+		logger.error(errmsg)
+		raise EvalError(description=errmsg)
+
 class Word(FunctionWithArguments):
 	name = "word"
+	__slots__ = ()
+	pure = True
 	num_args = 2
 
 	def eval(self, symbol_table):
-		n_s = "".join(t.eval(symbol_table) for t in self.args[0])
-		text_s = "".join(t.eval(symbol_table) for t in self.args[1])
-
-		try:
-			idx = int(n_s)
-		except ValueError:
-			raise ParseError
+		idx = _number_arg(self, "first", self.args[0], symbol_table)
 
 		if idx <= 0:
 			errmsg = "first argument to '{.name}' must be greater than 0.".format(self)
 			logger.error(errmsg)
 			raise EvalError(description=errmsg)
 
-		try:
-			return text_s.split()[idx]
-		except IndexError:
-			return ""
+		# 1-based
+		words = arg_words(self.args[1], symbol_table)
+		return words[idx-1] if idx <= len(words) else ""
+
+class Wordlist(FunctionWithArguments):
+	# $(wordlist s,e,text) words s through e (1-based, inclusive)
+	name = "wordlist"
+	__slots__ = ()
+	pure = True
+	num_args = 3
+
+	def wordlist(self, symbol_table):
+		start = _number_arg(self, "first", self.args[0], symbol_table)
+		end = _number_arg(self, "second", self.args[1], symbol_table)
+
+		if start <= 0:
+			errmsg = "invalid first argument to '{0}' function: '{1}'".format(self.name, start)
+			logger.error(errmsg)
+			raise EvalError(description=errmsg)
+		if end < 0:
+			errmsg = "invalid second argument to '{0}' function: '{1}'".format(self.name, end)
+			logger.error(errmsg)
+			raise EvalError(description=errmsg)
+
+		words = arg_words(self.args[2], symbol_table)
+		return WordList(words.words()[start-1:end])
+
+	def eval(self, symbol_table):
+		return str(self.wordlist(symbol_table))
+
+class Call(FunctionWithArguments):
+	# $(call name,arg1,arg2,...)
+	#
+	# The macro's value is an Expression which compiles once (see
+	# Expression.emitter()); $1..$N in it compile to slot references into
+	# the innermost argument frame (see VarRef.compile()) so a call is a
+	# frame push plus running the compiled body.
+	name = "call"
+	__slots__ = ()
+	num_args = None
+
+	def eval(self, symbol_table):
+		name = evaluate(self.args[0], symbol_table).strip()
+		args = [evaluate(arg, symbol_table) for arg in self.args[1:]]
+		logger.debug("%s %s args=%s", self.name, name, args)
+		return symbol_table.call(name, args)
+
+class Foreach(FunctionWithArguments):
+	# $(foreach var,list,text)
+	#
+	# The words of list are produced one at a time, var is bound in a loop
+	# slot of the symbol table (see SymbolTable.foreach()) and each
+	# expansion of text goes straight into the caller's chunk list.
+	name = "foreach"
+	__slots__ = ()
+	num_args = 3
+
+	def compile(self):
+		var_fn, list_fn, text_fn = [Expression(arg).emitter() for arg in self.args]
+
+		def foreach(symbol_table, out):
+			chunks = []
+			var_fn(symbol_table, chunks)
+			name = "".join(chunks).strip()
+			chunks = []
+			list_fn(symbol_table, chunks)
+			logger.debug("%s %s", self.name, name)
+			symbol_table.foreach(name, iter_words("".join(chunks)), text_fn, out)
+		return foreach
+
+	def eval(self, symbol_table):
+		out = []
+		self.emitter()(symbol_table, out)
+		return "".join(out)
+
+class Origin(Function):
+	name = "origin"
+	__slots__ = ()
+
+	def eval(self, symbol_table):
+		s = evaluate(self.token_list, symbol_table)
+		return symbol_table.origin(s.strip())
+
+class Flavor(Function):
+	name = "flavor"
+	__slots__ = ()
+
+	def eval(self, symbol_table):
+		s = evaluate(self.token_list, symbol_table)
+		return symbol_table.flavor(s.strip())
 
 class Shell(Function):
 	name = "shell"
+	__slots__ = ()
 
 	def eval(self, symbol_table):
+		symbol_table.impure()
 		s = "".join([t.eval(symbol_table) for t in self.token_list])
 		logger.debug("%s s=\"%s\"", self.name, s)
 		return shell.execute(s)
 
+# $(eval) text -> parsed statements, most recently used last. Generated
+# fragments (e.g., $(eval $(call template,$m)) for every module) are often
+# identical so each distinct text is tokenized once.
+eval_cache_size = 1024
+_eval_cache = collections.OrderedDict()
+
+def parse_eval_text(s):
+	# the statements of s (shared; don't modify)
+	try:
+		statements = _eval_cache[s]
+	except KeyError:
+		pass
+	else:
+		_eval_cache.move_to_end(s)
+		return statements
+
+	# (imported here; pymake imports this module)
+	import pymake
+	import source
+
+	logger.debug("eval parse len=%d", len(s))
+	text = s if s.endswith("\n") else s + "\n"
+	statements = pymake.parse_makefile_from_src(source.SourceString(text, "(eval)")).token_list
+	_eval_cache[s] = statements
+	while len(_eval_cache) > eval_cache_size:
+		_eval_cache.popitem(last=False)
+	return statements
+
+class Eval(Function):
+	name = "eval"
+	__slots__ = ()
+
+	def eval(self, symbol_table):
+		# the text can assign anything so whatever expansion we're part of
+		# can't be cached
+		symbol_table.impure()
+		s = evaluate(self.token_list, symbol_table)
+		logger.debug("%s \"%s\"", self.name, s)
+		for statement in parse_eval_text(s):
+			statement.eval(symbol_table)
+		return ""
+
 def split_function_call(s):
 	# break something like "info hello world" that needs a secondary parse
 	# into a proper looking function call
@@ -296,14 +527,23 @@ def split_function_call(s):
 
 _classes = {
 	# please keep in alphabetical order
+	"call" : Call,
 	"error" : Error,
+	"eval" : Eval,
+	"filter" : Filter,
+	"filter-out" : FilterOut,
 	"firstword" : FirstWord,
+	"flavor" : Flavor,
+	"foreach" : Foreach,
 	"info" : Info,
 	"lastword" : LastWord,
+	"origin" : Origin,
 	"shell" : Shell,
+	"sort" : Sort,
 	"subst" : Subst,
 	"warning" : MWarning,
 	"word" : Word,
+	"wordlist" : Wordlist,
 	"words" : Words,
 }
 
@@ -0,0 +1,68 @@
+# Hash-consing of AST nodes.
+#
+# Big makefiles repeat the same subtrees over and over, e.g., the same
+# "$(CC) $(CFLAGS) -c $< -o $@" recipe or prerequisite list across thousands
+# of rules. Every Symbol carries a structural hash (see symbol.py) so
+# identical subtrees can be found with a dict and stored once.
+#
+# Sharing is optional. A shared node's VChars point to the first occurrence so
+# error positions inside a shared subtree will report that first occurrence.
+
+import logging
+
+logger = logging.getLogger("pymake.hashcons")
+
+from symbol import *
+
+__all__ = [ "HashConsTable", ]
+
+class HashConsTable(object):
+	def __init__(self):
+		# node -> canonical node
+		self.nodes = {}
+		self.hits = 0
+
+	def intern(self, node):
+		# Return the canonical instance of node, sharing node's children
+		# first (bottom up).
+		if isinstance(node, Expression):
+			token_list = tuple(self.intern(t) for t in node.token_list)
+			if any(a is not b for a, b in zip(token_list, node.token_list)):
+				# equal children so the structural hash doesn't change
+				node.token_list = token_list
+
+			# parsed function arguments reference the same tokens
+			args = getattr(node, "args", None)
+			if args:
+				node.args = tuple(tuple(self.intern(t) for t in arg) for arg in args)
+
+			if isinstance(node, RuleExpression):
+				# statements are never shared (add_recipe_list() modifies them)
+				node.recipe_list = node.token_list[3]
+				return node
+
+		elif isinstance(node, Directive):
+			# directives are statements; share their contents only
+			if isinstance(node, ConditionalBlock):
+				# (the hash is only the class so doesn't change)
+				node.cond_exprs = [self.intern(expr) for expr in node.cond_exprs]
+				node.cond_blocks = [[self.intern(block) for block in block_list]
+										for block_list in node.cond_blocks]
+			elif node.expression:
+				node.expression = self.intern(node.expression)
+			return node
+
+		elif not isinstance(node, Symbol):
+			return node
+
+		canonical = self.nodes.setdefault(node, node)
+		if canonical is not node:
+			self.hits += 1
+		return canonical
+
+	def intern_makefile(self, makefile):
+		# share subtrees across all the statements of a Makefile (in place)
+		for idx, tok in enumerate(makefile.token_list):
+			makefile.token_list[idx] = self.intern(tok)
+		logger.debug("hashcons nodes=%d hits=%d", len(self.nodes), self.hits)
+		return makefile
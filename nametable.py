@@ -0,0 +1,55 @@
+# Name interning table.
+#
+# Variable names and target names are mentioned over and over (millions of
+# times in big makefiles). Map each name to one canonical python string (and
+# optionally a small integer id) so dict lookups and comparisons can hit the
+# identity fast path and the string's hash is computed once.
+
+import logging
+
+logger = logging.getLogger("pymake.nametable")
+
+__all__ = [ "NameTable",
+			"names",
+		  ]
+
+class NameTable(object):
+	def __init__(self):
+		# name -> canonical name
+		self.names = {}
+		# canonical name -> integer id (assigned on demand)
+		self.ids = {}
+		# integer id -> canonical name
+		self.id_names = []
+
+	def intern(self, s):
+		# return the canonical instance of string s
+		try:
+			return self.names[s]
+		except KeyError:
+			self.names[s] = s
+			return s
+
+	def id(self, s):
+		# return a small integer id for s (stable for the life of the table)
+		s = self.intern(s)
+		try:
+			return self.ids[s]
+		except KeyError:
+			n = len(self.id_names)
+			self.ids[s] = n
+			self.id_names.append(s)
+			return n
+
+	def name(self, n):
+		# reverse of id()
+		return self.id_names[n]
+
+	def __len__(self):
+		return len(self.names)
+
+	def __contains__(self, s):
+		return s in self.names
+
+# parse-wide and eval-wide default table
+names = NameTable()
@@ -0,0 +1,134 @@
+# Parse-time constant folding.
+#
+# Lots of expressions are constant: a := RHS without a '$', ifeq tests on
+# literal strings, $(subst) with all literal arguments. Fold them once
+# instead of at every eval:
+#
+#	- neighbouring Literals in an expression are merged into one Literal
+#	  (the merged VCharString keeps every char's original position)
+#	- a pure function (class attribute pure=True) whose arguments are all
+#	  Literals is replaced by a Literal of its result
+#
+# The pass is a functional rewrite: changed nodes are copies and unchanged
+# subtrees are returned as-is, never modified, so a tree shared through
+# hashcons.py or the parse cache is safe.
+#
+# Only what gets evaluated is touched: assignments, directive expressions
+# and conditional tests. Rules and recipes are left alone (target lists are
+# space separated Literals; merging them would change the rule).
+
+import logging
+
+logger = logging.getLogger("pymake.optimize")
+
+from symbol import *
+import functions
+from printable import printable_char
+from vline import VChar, VCharString
+from error import MakeError
+
+__all__ = [ "optimize",
+			"optimize_makefile",
+		  ]
+
+def _copy(node, **slots):
+	# shallow copy of a node with some slots replaced; the structural hash
+	# is recomputed
+	cls = node.__class__
+	new = cls.__new__(cls)
+	for klass in cls.__mro__:
+		for name in klass.__dict__.get("__slots__", ()):
+			if name.startswith("_"):
+				continue
+			try:
+				setattr(new, name, getattr(node, name))
+			except AttributeError:
+				pass
+	for name, value in slots.items():
+		setattr(new, name, value)
+	new._hash = new._structural_hash()
+	return new
+
+def _merge_literals(token_list):
+	merged = []
+	for t in token_list:
+		if isinstance(t, Literal) and merged and isinstance(merged[-1], Literal):
+			prev = merged[-1]
+			chars = (prev.string.chars if prev.string else []) + \
+					(t.string.chars if t.string else [])
+			merged[-1] = Literal(VCharString(chars))
+		else:
+			merged.append(t)
+	return merged
+
+def _first_vchar(node):
+	for t in node.token_list:
+		if isinstance(t, Literal) and t.string:
+			return t.string[0]
+	return None
+
+def _fold_function(node):
+	# $(subst a,b,aaa) -> Literal("bbb")
+	if not all(isinstance(t, Literal) for t in node.token_list):
+		return node
+
+	try:
+		value = node.eval(None)
+	except MakeError:
+		# leave the error for eval time
+		return node
+
+	# Literal.eval() returns printable_string() of its text so only fold
+	# if the Literal will give back exactly this value
+	if "".join([printable_char(c) for c in value]) != value:
+		return node
+
+	# the chars get the position of the function call
+	vchar = _first_vchar(node)
+	if vchar is None:
+		return node
+	logger.debug("fold %s -> \"%s\"", node.name, value)
+	return Literal(VCharString([VChar(c, vchar.pos, vchar.filename) for c in value]))
+
+def optimize(node):
+	# return node with constant subexpressions folded
+	if isinstance(node, functions.Function):
+		# a function's arguments are parsed from its token_list so the tokens
+		# are left alone
+		if node.pure:
+			return _fold_function(node)
+		return node
+
+	if isinstance(node, (RuleExpression, PrerequisiteList, Recipe, RecipeList)):
+		return node
+
+	if isinstance(node, Expression):
+		token_list = [optimize(t) for t in node.token_list]
+		if node.__class__ in (Expression, VarRef):
+			token_list = _merge_literals(token_list)
+		if len(token_list)==len(node.token_list) and \
+				all(a is b for a, b in zip(token_list, node.token_list)):
+			return node
+		return _copy(node, token_list=tuple(token_list))
+
+	if isinstance(node, ConditionalBlock):
+		cond_exprs = [optimize(expr) for expr in node.cond_exprs]
+		if all(a is b for a, b in zip(cond_exprs, node.cond_exprs)):
+			return node
+		return _copy(node, cond_exprs=cond_exprs,
+					 cond_blocks=[list(block) for block in node.cond_blocks])
+
+	if isinstance(node, Directive) and not isinstance(node, DefineDirective):
+		if node.expression is None:
+			return node
+		expression = optimize(node.expression)
+		if expression is node.expression:
+			return node
+		return _copy(node, expression=expression)
+
+	return node
+
+def optimize_makefile(makefile):
+	# returns a new Makefile; makefile isn't modified
+	token_list = [optimize(tok) for tok in makefile.token_list]
+	return Makefile(token_list)
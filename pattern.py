@@ -0,0 +1,93 @@
+# % patterns e.g., %.c lib%.a foo.o
+#
+# PatternIndex matches a word against many patterns at once. Patterns
+# without a % go in a set. The rest are keyed on their suffix: a word is
+# sliced once per distinct suffix length (a handful; .c .h .o .cpp ...) and
+# the slice looked up, then only the patterns in that suffix's bucket have
+# their prefixes checked (again one lookup per prefix length in the
+# bucket). Filtering 100k words against hundreds of patterns is then close
+# to constant work per word, however many patterns or prefixes there are.
+
+import logging
+import functools
+
+logger = logging.getLogger("pymake.pattern")
+
+__all__ = [ "split_pattern",
+			"PatternIndex",
+			"compile_patterns",
+		  ]
+
+def split_pattern(pattern):
+	# (prefix, suffix) around the first unescaped %, or None if there's no %.
+	# \% is a literal %.
+	idx = 0
+	while True:
+		idx = pattern.find("%", idx)
+		if idx < 0:
+			return None
+		if idx and pattern[idx-1]=="\\":
+			idx += 1
+			continue
+		break
+	prefix = pattern[:idx].replace("\\%", "%")
+	suffix = pattern[idx+1:].replace("\\%", "%")
+	return prefix, suffix
+
+def _unescape(pattern):
+	return pattern.replace("\\%", "%")
+
+class PatternIndex(object):
+	def __init__(self, patterns=()):
+		# words matched exactly
+		self.exact = set()
+		# suffix -> { len(prefix) : set of prefixes }
+		self.suffixes = {}
+		# the distinct suffix lengths, shortest first
+		self._suffix_lengths = []
+		for pattern in patterns:
+			self.add(pattern)
+
+	def add(self, pattern):
+		split = split_pattern(pattern)
+		if split is None:
+			self.exact.add(_unescape(pattern))
+			return
+		prefix, suffix = split
+		bucket = self.suffixes.setdefault(suffix, {})
+		bucket.setdefault(len(prefix), set()).add(prefix)
+		if len(suffix) not in self._suffix_lengths:
+			self._suffix_lengths = sorted(self._suffix_lengths + [len(suffix)])
+
+	def match(self, word):
+		if word in self.exact:
+			return True
+		suffixes = self.suffixes
+		n = len(word)
+		for slen in self._suffix_lengths:
+			if slen > n:
+				break
+			bucket = suffixes.get(word[n-slen:])
+			if bucket is None:
+				continue
+			for plen, prefixes in bucket.items():
+				# (prefix and suffix can't overlap)
+				if plen + slen <= n and word[:plen] in prefixes:
+					return True
+		return False
+
+	def filter(self, words):
+		# the words that match, in order
+		match = self.match
+		return [word for word in words if match(word)]
+
+	def filter_out(self, words):
+		# the words that don't match, in order
+		match = self.match
+		return [word for word in words if not match(word)]
+
+@functools.lru_cache(maxsize=256)
+def compile_patterns(patterns):
+	# PatternIndex of a tuple of patterns; the same pattern list (usually
+	# literal text in the makefile) is indexed once
+	return PatternIndex(patterns)
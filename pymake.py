@@ -7,6 +7,7 @@
 #
 # davep 09-sep-2014
 
+import os
 import sys
 import logging
 
@@ -22,11 +23,15 @@ from scanner import ScannerIterator
 import vline
 from vline import VirtualLine
 from printable import printable_char, printable_string
+import symbol
 from symbol import *
 from error import *
 from version import Version
 import functions 
 import source
+import cache
+import walker
+import optimize
 
 #whitespace = set( ' \t\r\n' )
 whitespace = set(' \t')
@@ -524,7 +529,7 @@ def tokenize_rule_prereq_or_assign(vchar_scanner):
 		lhs = tokenize_statement_LHS(vchar_scanner)
 		statement = list(lhs)
 
-		assert lhs[-1].vchar_scanner in assignment_operators
+		assert isinstance(lhs[-1], AssignOp), (type(lhs[-1]),)
 
 		statement.append( tokenize_assign_RHS(vchar_scanner) )
 		rhs = AssignmentExpression( statement )
@@ -1053,10 +1058,10 @@ def parse_recipes(line_scanner, semicolon_vline=None):
 					state = state_recipe_backslash
 				else :
 					# single line
-					recipe_vline = vline.RecipeVirtualLine([line], line_scanner.idx)
+					recipe_vline = vline.RecipeVirtualLine([line], line_scanner.first_line+line_scanner.idx)
 					recipe = tokenize_recipe(iter(recipe_vline))
 					logger.debug("recipe=%s", recipe.makefile())
-					recipe.set_code(recipe_vline)
+					recipe.set_recipe(recipe_vline)
 					recipe_list.append(recipe)
 			else : 
 				line_stripped = line.strip()
@@ -1089,9 +1094,9 @@ def parse_recipes(line_scanner, semicolon_vline=None):
 			if not line.endswith('\\\n'):
 				# now have an array of lines that need to be one line for the
 				# recipes tokenizer
-				recipe_vline = vline.RecipeVirtualLine(lines_list, line_scanner.idx)
+				recipe_vline = vline.RecipeVirtualLine(lines_list, line_scanner.first_line+line_scanner.idx)
 				recipe = tokenize_recipe(iter(recipe_vline))
-				recipe.set_code(recipe_vline)
+				recipe.set_recipe(recipe_vline)
 				recipe_list.append(recipe)
 
 				# go back and look for more
@@ -1183,7 +1188,7 @@ def handle_conditional_directive(directive_inst, vline_iter, line_scanner):
 	assert isinstance(directive_inst,ConditionalDirective), type(directive_inst)
 
 	print( "handle_conditional_directive() \"{0}\" line={1}".format(
-		directive_inst.name, line_scanner.idx-1))
+		directive_inst.name, line_scanner.first_line+line_scanner.idx-1))
 
 	state_if = 1
 	state_else = 3
@@ -1236,7 +1241,7 @@ def handle_conditional_directive(directive_inst, vline_iter, line_scanner):
 			# save the block of stuff we've read
 			line_list = save_block(line_list)
 
-			print("phys_line={0}".format(printable_string(phys_line)))
+			print("phys_line={0}".format(printable_string(virt_line)))
 
 			# handle "else if"
 			elseif = seek_elseif(virt_line)
@@ -1266,7 +1271,7 @@ def handle_conditional_directive(directive_inst, vline_iter, line_scanner):
 
 		else : 
 			# save the line into the block
-			print("save \"{0}\"".format(printable_string(str(virt_line))))
+			print("save \"{0}\"".format(printable_string(virt_line)))
 			line_list.append(virt_line)
 
 		if state==state_endif : 
@@ -1561,7 +1566,7 @@ def parse_makefile_from_src(src):
 
 	# ScannerIterator across the file_lines array (to support pushback of an
 	# entire line). 
-	line_scanner = ScannerIterator(src.file_lines)
+	line_scanner = ScannerIterator(src.file_lines, src.first_line)
 
 	# get_vline() returns a Python <generator> that walks across makefile
 	# lines, joining backslashed lines into VirtualLine instances.
@@ -1587,18 +1592,31 @@ def parse_makefile_from_src(src):
 #		print(err,file=sys.stderr)
 #		raise
 
-def parse_makefile(infilename) : 
+def parse_makefile(infilename, parse_cache=None) : 
+	# parse_cache - optional cache.ParseCache; unchanged files are loaded
+	# from the cache without being tokenized
 	logger.debug("parse_makefile infilename=%s", infilename)
+
+	if parse_cache is not None:
+		makefile, key = parse_cache.lookup(infilename)
+		if makefile is not None:
+			return makefile
+
 	src = source.SourceFile(infilename)
 
 	try : 
-		return parse_makefile_from_src(src)
+		makefile = parse_makefile_from_src(src)
 #		return parse_makefile_from_strlist(file_lines)
 	except ParseError as err:
 		err.filename = infilename
 		print(err, file=sys.stderr)
 		raise
 
+	if parse_cache is not None:
+		parse_cache.store(infilename, key, makefile)
+
+	return makefile
+
 def round_trip(makefile):
 	dumpmakefile="""
 print("# start makefile")
@@ -1617,22 +1635,17 @@ print("# end makefile")
 		
 
 def find_pos(tok):
-	# recursively descend into a token tree to find a token with a non-null vcharstring
+	# descend into a token tree to find the tokens with a non-null vcharstring
 	# which will show the starting filename/position of the token
 	logger.debug("find_pos tok=%s", tok)
 
-	# If the tok has a token_list, it's an Expression
-	# otherwise, is a Symbol.
-	#
 	# Expressions contain list of Symbols (although an Expression is also
 	# itself a Symbol). Expression does not have a string (VCharString)
 	# associated with it but contains the Symbols that do.
-	try:
-		for t in tok.token_list:
-			find_pos(t)
-	except AttributeError:
-		# we found a Symbol
-		for c in tok.string:
+	for t in walker.iter_nodes(tok):
+		if isinstance(t, Expression) or not isinstance(t.string, vline.VCharString):
+			continue
+		for c in t.string:
 			logger.debug("%s %s %s", c, c.pos, c.filename)
 
 def execute(makefile):
@@ -1672,8 +1685,16 @@ if __name__=='__main__':
 		sys.exit(1)
 
 	infilename = sys.argv[1]
+
+	# skip the (expensive) AST validation outside of tests
+	symbol.checked = False
+
+	# the parse cache writes under ~/.cache/pymake (or $PYMAKE_CACHE_DIR)
+	# so is only used when asked for with $PYMAKE_CACHE=1
+	parse_cache = cache.ParseCache() if os.getenv("PYMAKE_CACHE") else None
+
 	try : 
-		makefile = parse_makefile(infilename)
+		makefile = parse_makefile(infilename, parse_cache)
 	except ParseError:
 		# TODO dump lots of lovely useful information about the failure.
 		sys.exit(1)
@@ -1686,4 +1707,6 @@ if __name__=='__main__':
 #	print(makefile.makefile())
 #	print("# end makefile")
 
-	execute(makefile)
+	# fold constants before evaluating (a new tree; the cached AST is the
+	# original)
+	execute(optimize.optimize_makefile(makefile))
@@ -6,13 +6,17 @@
 # Moved most responsibility to run_tests.sh
 # davep 26-Nov-2014
 
+import io
 import sys
 import subprocess
 import tempfile
+import contextlib
 
 from pymake import *
 import pymake
-from vline import VirtualLine
+import source
+from vline import VirtualLine, VCharString
+from symtable import SymbolTable
 import hexdump
 from printable import printable_string
 
@@ -20,6 +24,29 @@ from printable import printable_string
 if sys.version_info.major < 3:
 	raise Exception("Requires Python 3.x")
 
+def vcs(s):
+	# VCharString of a python string (for building an AST by hand)
+	return VCharString.from_string(s)
+
+def parse_string(src, name="test.mk"):
+	# Makefile from makefile text; the tokenizer's chatter is dropped
+	with contextlib.redirect_stdout(io.StringIO()):
+		return pymake.parse_makefile_from_src(source.SourceString(src, name))
+
+def eval_makefile(makefile, symbol_table):
+	# evaluate every statement (quietly); returns symbol_table
+	with contextlib.redirect_stdout(io.StringIO()):
+		for tok in makefile:
+			tok.eval(symbol_table)
+	return symbol_table
+
+def run(src, symbol_table=None):
+	# parse and evaluate makefile text; returns the SymbolTable (by default
+	# a new one with an empty environment)
+	if symbol_table is None:
+		symbol_table = SymbolTable(environ={})
+	return eval_makefile(parse_string(src), symbol_table)
+
 def run_tests_list(tests_list,tokenizer):
 	for idx,test in enumerate(tests_list) :
 		s,validate = test
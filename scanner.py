@@ -17,9 +17,13 @@ if sys.version_info.major < 3:
 class ScannerIterator(object):
 	# string iterator that allows look ahead and push back
 	# can also push/pop state (for deep lookaheads)
-	def __init__(self, data):
+	#
+	# first_line - for a scanner across lines, the line number of data[0]
+	#	(e.g., the lines of a LineBlock from the middle of a file)
+	def __init__(self, data, first_line=0):
 		logger.debug("ScannerIterator datalen=%d", len(data))
 		self.data = data
+		self.first_line = first_line
 		self.idx = 0
 		self.max_idx = len(self.data)
 		self.state_stack = []
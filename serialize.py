@@ -0,0 +1,434 @@
+# Compact binary serialization of a Makefile and the Symbol hierarchy.
+#
+# Used for the parse cache, IPC and debugger snapshots. Much smaller and
+# faster than round_trip()'s "write python source then re-execute it".
+#
+# Layout (all integers are LEB128 varints, signed values are zigzag'd):
+#
+#	magic "PYMKAST" + format version (one byte)
+#	schema:        length, ascii bytes (see schema())
+#	string table:  count, then (length, utf8 bytes) per string
+#	body:          one value (normally the Makefile)
+#
+# A value is a tag byte followed by a tag specific payload. Nodes are stored
+# as the class name (string table index) followed by the node's slots in
+# class order. Slots beginning with '_' are caches and aren't written (except
+# the structural hash, which is stable across processes).
+#
+# format_version covers the layout above. The nodes' own layout (the Symbol
+# classes and their slots, in order) and what the stored structural hash
+# depends on (it's a python tuple hash) are covered by schema(), which is
+# computed so adding a slot can't silently load old data into the wrong
+# slots.
+#
+# A node seen twice (e.g., RuleExpression.recipe_list is also in its
+# token_list, or subtrees shared by hashcons.py) is written once and then
+# referenced by index.
+#
+# A VCharString is a source map record: its text (including hidden chars),
+# then runs of (filename, row, col, length) for consecutive chars, then the
+# indices of any hidden chars.
+#
+# LineBlock and RecipeList are written with their byte length so the reader
+# can skip them. They're loaded the first time one of their slots is touched
+# (see symbol.LazyLoad). A lazy node's payload has its own scope of node
+# references.
+
+import sys
+import hashlib
+import logging
+
+logger = logging.getLogger("pymake.serialize")
+
+from symbol import *
+import functions
+from vline import VChar, VCharString, VirtualLine, RecipeVirtualLine
+
+__all__ = [ "dumps",
+			"loads",
+			"dump",
+			"load",
+			"schema",
+		  ]
+
+magic = b"PYMKAST"
+format_version = 3
+
+# value tags
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_INT = 3
+TAG_STR = 4
+TAG_TUPLE = 5
+TAG_LIST = 6
+TAG_VCHARSTRING = 7
+TAG_NODE = 8
+TAG_LAZY_NODE = 9
+TAG_VIRTUALLINE = 10
+TAG_MAKEFILE = 11
+TAG_UNSET = 12
+TAG_REF = 13
+
+# nodes of these classes are loaded on demand
+lazy_classes = (LineBlock, RecipeList)
+
+def _all_subclasses(cls):
+	for sub in cls.__subclasses__():
+		yield sub
+		yield from _all_subclasses(sub)
+
+# class name -> class
+_node_classes = {}
+def node_class(name):
+	try:
+		return _node_classes[name]
+	except KeyError:
+		# (re)scan; Symbol subclasses can be defined after we're imported
+		_node_classes.update({ cls.__name__ : cls for cls in _all_subclasses(Symbol) })
+		return _node_classes[name]
+
+vline_classes = { cls.__name__ : cls for cls in (VirtualLine, RecipeVirtualLine) }
+
+_slot_cache = {}
+def node_slots(cls):
+	# the slots of a node class that are written to disk, in MRO order
+	try:
+		return _slot_cache[cls]
+	except KeyError:
+		pass
+	slots = []
+	for klass in reversed(cls.__mro__):
+		for name in klass.__dict__.get("__slots__", ()):
+			if name.startswith("_") and name != "_hash":
+				continue
+			slots.append(name)
+	_slot_cache[cls] = tuple(slots)
+	return _slot_cache[cls]
+
+# (number of Symbol classes, fingerprint) so schema() is computed once
+# unless more classes appear
+_schema = (0, None)
+
+def schema():
+	# Fingerprint of every Symbol class and the slots written for it, plus
+	# the interpreter details the stored _hash depends on.
+	global _schema
+	classes = list(_all_subclasses(Symbol))
+	if _schema[0]==len(classes):
+		return _schema[1]
+
+	h = hashlib.sha1()
+	h.update("python={0}.{1} hash={2}\n".format(sys.version_info[0], sys.version_info[1],
+				sys.hash_info.width).encode("utf8"))
+	for cls in sorted(classes, key=lambda cls: cls.__name__):
+		h.update("{0}:{1}\n".format(cls.__name__, ",".join(node_slots(cls))).encode("utf8"))
+	_schema = (len(classes), h.hexdigest()[:16])
+	return _schema[1]
+
+class Writer(object):
+	def __init__(self):
+		self.strings = {}
+		self.out = bytearray()
+		# id(node) -> reference index
+		self.memo = {}
+
+	def string_index(self, s):
+		try:
+			return self.strings[s]
+		except KeyError:
+			n = len(self.strings)
+			self.strings[s] = n
+			return n
+
+	def uint(self, n, out=None):
+		out = self.out if out is None else out
+		while True:
+			byte = n & 0x7f
+			n >>= 7
+			if n:
+				out.append(byte | 0x80)
+			else:
+				out.append(byte)
+				return
+
+	def int(self, n):
+		# zigzag so small negative numbers stay small
+		self.uint((n << 1) ^ -1 if n < 0 else n << 1)
+
+	def str(self, s):
+		self.uint(self.string_index(s))
+
+	def value(self, v):
+		out = self.out
+		if v is None:
+			out.append(TAG_NONE)
+		elif v is False:
+			out.append(TAG_FALSE)
+		elif v is True:
+			out.append(TAG_TRUE)
+		elif isinstance(v, int):
+			out.append(TAG_INT)
+			self.int(v)
+		elif isinstance(v, str):
+			out.append(TAG_STR)
+			self.str(v)
+		elif isinstance(v, tuple):
+			out.append(TAG_TUPLE)
+			self.uint(len(v))
+			for item in v:
+				self.value(item)
+		elif isinstance(v, list):
+			out.append(TAG_LIST)
+			self.uint(len(v))
+			for item in v:
+				self.value(item)
+		elif isinstance(v, VCharString):
+			out.append(TAG_VCHARSTRING)
+			self.vcharstring(v)
+		elif isinstance(v, Symbol):
+			ref = self.memo.get(id(v))
+			if ref is not None:
+				out.append(TAG_REF)
+				self.uint(ref)
+				return
+			self.memo[id(v)] = len(self.memo)
+
+			if isinstance(v, lazy_classes):
+				out.append(TAG_LAZY_NODE)
+				self.str(v.__class__.__name__)
+				# write the payload into its own buffer (and reference scope)
+				# so we know its length
+				save = self.out, self.memo
+				self.out = bytearray()
+				self.memo = {}
+				self.node_slots(v)
+				payload = self.out
+				self.out, self.memo = save
+				self.uint(len(payload))
+				self.out += payload
+			else:
+				out.append(TAG_NODE)
+				self.str(v.__class__.__name__)
+				self.node_slots(v)
+		elif isinstance(v, VirtualLine):
+			out.append(TAG_VIRTUALLINE)
+			self.str(v.__class__.__name__)
+			self.str(v.filename)
+			self.int(v.starting_file_line)
+			self.uint(len(v.phys_lines))
+			for line in v.phys_lines:
+				self.str(line)
+		elif isinstance(v, Makefile):
+			out.append(TAG_MAKEFILE)
+			self.value(v.token_list)
+		else:
+			raise TypeError("can't serialize {0}".format(type(v)))
+
+	def node_slots(self, node):
+		for name in node_slots(node.__class__):
+			try:
+				v = getattr(node, name)
+			except AttributeError:
+				self.out.append(TAG_UNSET)
+				continue
+			self.value(v)
+
+	def vcharstring(self, vcstr):
+		chars = vcstr.chars
+		self.str("".join([vchar.char for vchar in chars]))
+
+		# runs of consecutive chars on the same row of the same file
+		runs = []
+		for vchar in chars:
+			row, col = vchar.pos
+			if runs:
+				run = runs[-1]
+				if run[0]==vchar.filename and run[1]==row and run[2]+run[3]==col:
+					run[3] += 1
+					continue
+			runs.append([vchar.filename, row, col, 1])
+
+		self.uint(len(runs))
+		for filename, row, col, length in runs:
+			self.str(filename)
+			self.int(row)
+			self.int(col)
+			self.uint(length)
+
+		hidden = [idx for idx, vchar in enumerate(chars) if vchar.hide]
+		self.uint(len(hidden))
+		for idx in hidden:
+			self.uint(idx)
+
+	def getvalue(self):
+		header = bytearray(magic)
+		header.append(format_version)
+		fingerprint = schema().encode("ascii")
+		self.uint(len(fingerprint), header)
+		header += fingerprint
+		self.uint(len(self.strings), header)
+		for s in self.strings:
+			b = s.encode("utf8")
+			self.uint(len(b), header)
+			header += b
+		return bytes(header + self.out)
+
+class LazyLoader(object):
+	# Remembers where a lazy node's slots live in the reader's data.
+	__slots__ = ("reader", "offset")
+
+	def __init__(self, reader, offset):
+		self.reader = reader
+		self.offset = offset
+
+	def load(self, node):
+		logger.debug("lazy load %s offset=%d", node.__class__.__name__, self.offset)
+		reader = self.reader
+		save = reader.pos, reader.memo
+		reader.pos = self.offset
+		reader.memo = []
+		try:
+			reader.fill_slots(node)
+		finally:
+			reader.pos, reader.memo = save
+
+class Reader(object):
+	def __init__(self, data):
+		self.data = data
+		self.pos = 0
+		# nodes in the order they were created (see TAG_REF)
+		self.memo = []
+
+		if bytes(data[:len(magic)]) != magic:
+			raise ValueError("not a pymake AST")
+		self.pos = len(magic)
+		version = data[self.pos]
+		self.pos += 1
+		if version != format_version:
+			raise ValueError("AST format version {0} != {1}".format(version, format_version))
+		length = self.uint()
+		fingerprint = str(data[self.pos:self.pos+length], "ascii")
+		self.pos += length
+		if fingerprint != schema():
+			raise ValueError("AST schema {0} != {1}".format(fingerprint, schema()))
+
+		count = self.uint()
+		self.strings = []
+		for n in range(count):
+			length = self.uint()
+			self.strings.append(str(data[self.pos:self.pos+length], "utf8"))
+			self.pos += length
+
+	def uint(self):
+		data = self.data
+		n = 0
+		shift = 0
+		while True:
+			byte = data[self.pos]
+			self.pos += 1
+			n |= (byte & 0x7f) << shift
+			if not byte & 0x80:
+				return n
+			shift += 7
+
+	def int(self):
+		n = self.uint()
+		return (n >> 1) ^ -(n & 1)
+
+	def str(self):
+		return self.strings[self.uint()]
+
+	def value(self):
+		tag = self.data[self.pos]
+		self.pos += 1
+
+		if tag==TAG_NODE:
+			cls = node_class(self.str())
+			node = cls.__new__(cls)
+			self.memo.append(node)
+			self.fill_slots(node)
+			return node
+		if tag==TAG_REF:
+			return self.memo[self.uint()]
+		if tag==TAG_STR:
+			return self.str()
+		if tag==TAG_VCHARSTRING:
+			return self.vcharstring()
+		if tag==TAG_TUPLE:
+			return tuple([self.value() for n in range(self.uint())])
+		if tag==TAG_LIST:
+			return [self.value() for n in range(self.uint())]
+		if tag==TAG_NONE:
+			return None
+		if tag==TAG_LAZY_NODE:
+			cls = node_class(self.str())
+			length = self.uint()
+			node = cls.__new__(cls)
+			self.memo.append(node)
+			node._lazy = LazyLoader(self, self.pos)
+			self.pos += length
+			return node
+		if tag==TAG_INT:
+			return self.int()
+		if tag==TAG_FALSE:
+			return False
+		if tag==TAG_TRUE:
+			return True
+		if tag==TAG_VIRTUALLINE:
+			cls = vline_classes[self.str()]
+			filename = self.str()
+			starting_file_line = self.int()
+			phys_lines = [self.str() for n in range(self.uint())]
+			return cls(phys_lines, starting_file_line, filename)
+		if tag==TAG_MAKEFILE:
+			makefile = Makefile.__new__(Makefile)
+			makefile.token_list = self.value()
+			return makefile
+		if tag==TAG_UNSET:
+			raise ValueError("unset slot outside a node")
+
+		raise ValueError("bad tag {0} at {1}".format(tag, self.pos-1))
+
+	def fill_slots(self, node):
+		data = self.data
+		for name in node_slots(node.__class__):
+			if data[self.pos]==TAG_UNSET:
+				self.pos += 1
+				continue
+			setattr(node, name, self.value())
+
+	def vcharstring(self):
+		text = self.str()
+		chars = []
+		idx = 0
+		for n in range(self.uint()):
+			filename = self.str()
+			row = self.int()
+			col = self.int()
+			for i in range(self.uint()):
+				chars.append(VChar(text[idx], (row, col+i), filename))
+				idx += 1
+		for n in range(self.uint()):
+			chars[self.uint()].hide = True
+
+		vcstr = VCharString()
+		vcstr.chars = chars
+		return vcstr
+
+def dumps(obj):
+	writer = Writer()
+	writer.value(obj)
+	return writer.getvalue()
+
+def loads(data):
+	# data must stay alive and unmodified while lazy nodes remain unloaded
+	# (the reader keeps a reference)
+	reader = Reader(data)
+	return reader.value()
+
+def dump(obj, outfile):
+	outfile.write(dumps(obj))
+
+def load(infile):
+	return loads(infile.read())
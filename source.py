@@ -1,9 +1,11 @@
-__all__ = [ "SourceFile" ]
+__all__ = [ "SourceFile", "SourceString", "SourceLines" ]
 
 class Source(object):
 	def __init__(self, name="(none)"):
 		self.name = name
 		self.file_lines = []
+		# line number of file_lines[0]
+		self.first_line = 0
 
 	def load(self):
 		pass
@@ -18,6 +20,19 @@ class SourceFile(Source):
 
 
 class SourceString(Source):
-	# TODO read from StringIO
-	pass
+	# makefile text from a python string
+	def __init__(self, s, name="(string)"):
+		super().__init__(name)
+		self.s = s
 
+	def load(self):
+		self.file_lines = self.s.splitlines(keepends=True)
+
+class SourceLines(Source):
+	# makefile text already split into lines (e.g., the contents of a
+	# LineBlock); name is the file the lines originally came from and
+	# first_line is where they started in it
+	def __init__(self, file_lines, name="(lines)", first_line=0):
+		super().__init__(name)
+		self.file_lines = file_lines
+		self.first_line = first_line
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import sys
+import zlib
 import logging
 
 logger = logging.getLogger("pymake.symbol")
@@ -8,6 +9,7 @@ logger = logging.getLogger("pymake.symbol")
 from printable import printable_char, printable_string
 from vline import VirtualLine, VCharString
 from version import Version
+from nametable import names
 from error import *
 from evaluate import evaluate
 import shell
@@ -41,16 +43,42 @@ __all__ = [ "Symbol",
 			"IfneqDirective",
 			"DefineDirective",
 			"Makefile",
+			"static_name",
 ]
 
+# test/debug flags
+# When set, every node validates its children as the AST is built. That walks
+# every VChar of every child so construction is O(total chars x depth). Tests
+# want it; production parses turn it off (see pymake.py __main__).
+checked = True
+
+def text_hash(s):
+	# Hash of a python string that's stable across processes (hash(str) is
+	# salted per process) so structural hashes can be stored on disk.
+	return zlib.crc32(s.encode("utf8"))
+
 #
 #  Class Hierarchy for Tokens
 #
 class Symbol(object):
 	# base class of everything we find in the makefile
+	#
+	# ASTs of big makefiles hold millions of these so every class in the
+	# hierarchy uses __slots__ (no per-instance __dict__). Subclasses must
+	# declare __slots__ too, even if empty, or they get a __dict__ back.
+	#
+	# Every node carries a structural hash computed once at construction
+	# (see _structural_hash()). Equality short-circuits on a hash mismatch
+	# and the hash lets identical subtrees be shared (see hashcons.py).
+	__slots__ = ("string", "_hash")
+
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		cls._class_hash = text_hash(cls.__name__)
+
 	def __init__(self, string=None):
 		# davep 24-Apr-2016 ; using array of vchar for the symbol now 
-		if string:
+		if string and checked:
 			# do you quack like a VCharString? everything must be VChar so know filename/pos
 			logger.debug("new Symbol string=\"%s\"", string)
 			try:
@@ -63,6 +91,15 @@ class Symbol(object):
 		# (descendent classes could store something different)
 		self.string = string
 
+		self._hash = self._structural_hash()
+
+	def _structural_hash(self):
+		# class + visible text (str() of a VCharString skips hidden chars)
+		return hash((self._class_hash, text_hash(str(self.string)) if self.string else 0))
+
+	def __hash__(self):
+		return self._hash
+
 	def __str__(self):
 		# create a string such as Literal("all")
 		# handle embedded " and ' (with backslashes I guess?)
@@ -71,16 +108,23 @@ class Symbol(object):
 	def __eq__(self, rhs):
 		# lhs is self
 		# compare to rhs
-		try:
-			return self.string == rhs.string
-		except AttributeError:
+		if not isinstance(rhs, Symbol):
 			# rhs can also be python string instead of VCharString
 			# e.g., ":=" "::=" 
 			return str(self.string) == rhs
 
+		if self._hash != rhs._hash:
+			return False
+		return self.__class__ is rhs.__class__ and str(self.string) == str(rhs.string)
+
 	def makefile(self):
 		# create a Makefile from this object
-		return str(self.string)
+		return "".join(self.fragments())
+
+	def fragments(self):
+		# Yield the makefile text of this object in pieces. Used to stream a
+		# regenerated makefile without building the whole string.
+		yield str(self.string)
 
 	@staticmethod
 	def validate(token_list):
@@ -100,22 +144,66 @@ class Symbol(object):
 		assert 0
 		return None
 
+	def compile(self):
+		# Return an emitter: a function f(symbol_table, out) that appends the
+		# chunks of self.eval(symbol_table) to the list out. Nested
+		# expansions append to the same list and only the outermost caller
+		# joins (so building long values isn't quadratic). Children override
+		# with something faster.
+		fn = self.eval
+		def emit(symbol_table, out):
+			out.append(fn(symbol_table))
+		return emit
+
+class LazyLoad(object):
+	# Mixin for nodes whose contents can be loaded on first access (see
+	# serialize.py). A lazy node starts life with only its _lazy slot filled
+	# in. __getattr__ is only called when normal lookup fails, i.e., when
+	# touching a slot that hasn't been loaded yet, so loaded nodes pay
+	# nothing.
+	__slots__ = ()
+
+	def __getattr__(self, name):
+		try:
+			loader = object.__getattribute__(self, "_lazy")
+		except AttributeError:
+			raise AttributeError(name) from None
+		del self._lazy
+		loader.load(self)
+		return getattr(self, name)
+
 class Literal(Symbol):
 	# A literal found in the token stream. Store as a string.
+	#
+	# The evaluated text never changes so it's computed on first eval. (It's
+	# not interned; most Literals are recipe and value text. Names are
+	# interned where they're used as names: VarRef.compile(), the
+	# SymbolTable's keys, Makefile's indexes.)
+	__slots__ = ("_value",)
 	
 	def eval(self, symbol_table):
-		return printable_string(self.string)
+		try:
+			return self._value
+		except AttributeError:
+			self._value = printable_string(self.string)
+			return self._value
+
+	def compile(self):
+		value = self.eval(None)
+		def literal(symbol_table, out):
+			out.append(value)
+		return literal
 
 class Operator(Symbol):
-	pass
+	__slots__ = ()
 
 class AssignOp(Operator):
 	# An assignment symbol, one of { = , := , ?= , += , != , ::= }
-	pass
+	__slots__ = ()
 	
 class RuleOp(Operator):
 	# A rule sumbol, one of { : , :: }
-	pass
+	__slots__ = ()
 
 
 class Expression(Symbol):
@@ -123,13 +211,28 @@ class Expression(Symbol):
 	# A Symbol will not have a token_list.
 	# A Symbol's self.string is the VCharString containing VChar knowing the
 	#	filename/pos of everything in the Makefile
+	#
+	# The token_list is stored as a tuple. Nodes aren't modified after
+	# construction (RuleExpression.add_recipe_list() swaps in a new tuple).
+	#
+	# eval() runs the compiled form of the expression (see compile()), built
+	# on first use and kept in _compiled, and joins its chunks.
+	__slots__ = ("token_list", "_compiled")
+
 	def __init__(self, token_list ):
 		# expect a list/array/tuple (test by calling len())
 		assert len(token_list)>=0, (type(token_list), token_list)
-		self.token_list = token_list
-		Symbol.validate(token_list)
+		self.token_list = tuple(token_list)
+		if checked:
+			Symbol.validate(token_list)
 		super().__init__()
 
+	def _structural_hash(self):
+		return hash((self._class_hash,) + tuple(t._hash for t in self.token_list))
+
+	def __hash__(self):
+		return self._hash
+
 	def __str__(self):
 		# return a ()'d list of our tokens
 		s = "{0}([".format(self.__class__.__name__)
@@ -147,6 +250,9 @@ class Expression(Symbol):
 		# rhs better be another expression
 		assert isinstance(rhs, Expression), (type(rhs), rhs)
 
+		if self._hash != rhs._hash:
+			return False
+
 		if len(self.token_list) != len(rhs.token_list):
 			logger.error("length mismatch %d != %d", len(self.token_list), len(rhs.token_list))
 			return False
@@ -157,24 +263,67 @@ class Expression(Symbol):
 				return False
 
 			# Recurse into sub-expressions. It's tokens all the way down!
-			if not str(tokens[0]) == str(tokens[1]) :
+			if not tokens[0] == tokens[1] :
 				logger.error("token mismatch %s != %s", tokens[0], tokens[1])
 				return False
 
 		return True
 
-	def makefile(self):
-		# Build a Makefile string from this rule expression.
-		return "".join([t.makefile() for t in self.token_list])
+	def fragments(self):
+		for t in self.token_list:
+			yield from t.fragments()
 			
 	def __len__(self):
 		return len(self.token_list)
 
-	def eval(self, symbol_table):
-		for e in self.token_list:
-			logger.debug("expression e=%s", e)
+	def emitter(self):
+		try:
+			return self._compiled
+		except AttributeError:
+			self._compiled = self.compile()
+			return self._compiled
+
+	def _compile_parts(self):
+		# Literal text is precomputed (and neighbouring Literals merged);
+		# everything else is an emitter.
+		parts = []
+		for t in self.token_list:
+			if isinstance(t, Literal):
+				value = t.eval(None)
+				if parts and isinstance(parts[-1], str):
+					parts[-1] += value
+				else:
+					parts.append(value)
+			elif isinstance(t, Expression):
+				parts.append(t.emitter())
+			else:
+				parts.append(t.compile())
+		return tuple(parts)
 
-		return "".join([e.eval(symbol_table) for e in self.token_list])
+	@staticmethod
+	def _join_parts(parts):
+		# build an emitter for the concatenation of parts
+		if len(parts)==1 and not isinstance(parts[0], str):
+			return parts[0]
+
+		def expression(symbol_table, out):
+			for p in parts:
+				if p.__class__ is str:
+					out.append(p)
+				else:
+					p(symbol_table, out)
+		return expression
+
+	def compile(self):
+		if self.__class__.eval is not Expression.eval:
+			# subclass with its own eval()
+			return Symbol.compile(self)
+		return self._join_parts(self._compile_parts())
+
+	def eval(self, symbol_table):
+		out = []
+		self.emitter()(symbol_table, out)
+		return "".join(out)
 
 class VarRef(Expression):
 	# A variable reference found in the token stream. Save as a nested set of
@@ -186,34 +335,57 @@ class VarRef(Expression):
 	# $(abc$(def)$(ghi$(jkl)))  ->  VarRef(abc,VarRef(def),VarRef(ghi,VarRef(jkl)),)
 	# $(abc$(def)xyz)		   ->  VarRef(abc,VarRef(def),Literal(xyz),)
 	# $(info this is a varref)  ->  VarRef(info this is a varref)
-
-	def makefile(self):
-		return "$(" + "".join([t.makefile() for t in self.token_list]) + ")"
+	__slots__ = ()
+
+	def fragments(self):
+		yield "$("
+		for t in self.token_list:
+			yield from t.fragments()
+		yield ")"
+
+	def compile(self):
+		if self.__class__.eval is not VarRef.eval:
+			# functions
+			return Symbol.compile(self)
+
+		# The name is evaluated (a computed name like $(SRC$(DIR)) is the
+		# concatenation of its parts) then expanded by the symbol table
+		# (which memoizes recursively expanded variables).
+		parts = self._compile_parts()
+		if all(isinstance(p, str) for p in parts):
+			name = names.intern("".join(parts))
+			if name.isdigit():
+				# $1 etc in a $(call) macro; a slot in the argument frame
+				slot = int(name)
+				def argref(symbol_table, out):
+					out.append(symbol_table.arg(slot, name))
+				return argref
+			def varref(symbol_table, out):
+				out.append(symbol_table.expand(name))
+			return varref
+
+		name_fn = self._join_parts(parts)
+		def varref(symbol_table, out):
+			name = []
+			name_fn(symbol_table, name)
+			out.append(symbol_table.expand("".join(name)))
+		return varref
 
 	def eval(self, symbol_table):
-		s = ""
-		for sym in self.token_list:
-#			print(type(sym), sym)
-			value = sym.eval(symbol_table)
-#			print(type(value), value)
-			ref = symbol_table.fetch(value)
-#			print(type(ref), ref)
-			if isinstance(ref,Expression):
-				# execute the expression
-				ref_value = ref.eval(symbol_table)
-#				print(type(ref_value), ref_value)
-				s += ref_value
-			else:
-				s += ref
-		return s
-#		return "".join([symbol_table.fetch(sym.eval(symbol_table)) for sym in self.token_list])
+		out = []
+		self.emitter()(symbol_table, out)
+		return "".join(out)
 
 class AssignmentExpression(Expression):
+	__slots__ = ()
+
 	def __init__(self, token_list):
 		super().__init__(token_list)
 		self.sanity()
 
-	def eval(self, symbol_table):
+	def eval(self, symbol_table, origin="file", targets=None):
+		# origin - see $(origin); "override" for an override directive
+		# targets - the targets of a target-specific assignment
 		self.sanity()
 		lhs = self.token_list[0].eval(symbol_table)
 		op = self.token_list[1]
@@ -227,6 +399,14 @@ class AssignmentExpression(Expression):
 			# recursively expanded
 			# store the expression in the symbol table without evaluating
 			rhs = self.token_list[2]
+		elif op == "+=":
+			# appended; the symbol table expands the RHS now if the variable
+			# is simply expanded
+			if targets:
+				symbol_table.add_specific(targets, lhs, self.token_list[2], origin, append=True)
+			else:
+				symbol_table.append(lhs, self.token_list[2], origin)
+			return None
 		elif op == "!=":
 			# != seems to be a > 3.81 feature so add a version check here
 			if Version.major < 4:
@@ -240,7 +420,10 @@ class AssignmentExpression(Expression):
 			raise Unimplemented("op=%s"%op)
 
 		logger.debug("assignment rhs=%s", rhs)
-		symbol_table.add(lhs, rhs)
+		if targets:
+			symbol_table.add_specific(targets, lhs, rhs, origin)
+		else:
+			symbol_table.add(lhs, rhs, origin)
 
 		return None
 
@@ -265,11 +448,11 @@ class RuleExpression(Expression):
 	#	  ::= Target Assignment 
 	#
 	# 
+	__slots__ = ("recipe_list",)
 
 	def __init__(self, token_list):
 		# add sanity check in constructor
-		Symbol.validate(token_list)
-
+		# (children are validated by Expression's constructor)
 		assert len(token_list)==3 or len(token_list)==4, len(token_list)
 
 		assert isinstance(token_list[0], Expression), (type(token_list[0]),)
@@ -285,14 +468,14 @@ class RuleExpression(Expression):
 		# If one not provied, start with a default empty recipe list
 		# (so this object will always have a RecipeList instance)
 		if len(token_list)==3 : 
-			self.recipe_list = RecipeList([]) 
-			token_list.append( self.recipe_list )
+			token_list = tuple(token_list) + (RecipeList([]),)
 		elif len(token_list)==4 : 
 			assert isinstance(token_list[3], RecipeList), (type(token_list[3]),)
+		self.recipe_list = token_list[3]
 
 		super().__init__(token_list)
 
-	def makefile(self):
+	def fragments(self):
 		# rule-targets rule-op prereq-list <CR>
 		#	 recipes
 		assert len(self.token_list)==4, len(self.token_list)
@@ -301,21 +484,23 @@ class RuleExpression(Expression):
 		# prerequisites
 		# 
 		# first the targets
-		s = " ".join( [ t.makefile() for t in self.token_list[0].token_list ] )
+		sep = ""
+		for t in self.token_list[0].token_list:
+			yield sep
+			yield from t.fragments()
+			sep = " "
 
 		# operator
-		s += self.token_list[1].makefile()
+		yield from self.token_list[1].fragments()
 
 		# prerequisite(s)
-		s += self.token_list[2].makefile()
+		yield from self.token_list[2].fragments()
 
 		# recipe(s)
-		recipe_list = self.token_list[3].makefile()
-		if recipe_list : 
-			s += "\n"
-			s += recipe_list
-			assert s[-1]=='\n'
-		return s
+		recipe_list = self.token_list[3]
+		if len(recipe_list):
+			yield "\n"
+			yield from recipe_list.fragments()
 
 	def add_recipe_list( self, recipe_list ) : 
 		assert isinstance(recipe_list, RecipeList)
@@ -324,12 +509,20 @@ class RuleExpression(Expression):
 		logger.debug("add_recipe_list() recipe_list=%s", str(recipe_list))
 
 		# replace my recipe list with this recipe list
-		self.token_list[3] = recipe_list
+		self.token_list = self.token_list[:3] + (recipe_list,)
 		self.recipe_list = recipe_list
+		self._hash = self._structural_hash()
 
 #		logger.debug("add_recipe_list() %s", self.makefile())
 
 	def eval(self, symbol_table):
+		if isinstance(self.token_list[2], AssignmentExpression):
+			# target-specific assignment e.g., foo : CC=mycc
+			targets = [t.eval(symbol_table) for t in self.token_list[0].token_list]
+			targets = " ".join(targets).split()
+			self.token_list[2].eval(symbol_table, targets=targets)
+			return None
+
 		# TODO
 		logger.error("%s eval not implemented yet", type(self))
 
@@ -338,18 +531,24 @@ class PrerequisiteList(Expression):
 	 # not an expression itself or wind up with problems with spaces
 	 #  $()a vs $() a
 	 # (note the space before 'a')
+	__slots__ = ()
 
 	def __init__(self, token_list):
 		for t in token_list :
 			assert isinstance(t, Expression), (type(t,))
 		super().__init__(token_list)
 
-	def makefile(self):
+	def fragments(self):
 		# space separated
-		return " ".join( [ t.makefile() for t in self.token_list ] )
+		sep = ""
+		for t in self.token_list:
+			yield sep
+			yield from t.fragments()
+			sep = " "
 
 class Recipe(Expression):
 	# A single line of a recipe
+	__slots__ = ("recipe",)
 
 	def __init__(self, token_list):
 		super().__init__(token_list)
@@ -358,24 +557,26 @@ class Recipe(Expression):
 	def set_recipe(self, recipe):
 		self.recipe = recipe
 
-class RecipeList( Expression ) : 
+class RecipeList( Expression, LazyLoad ) : 
 	# A collection of Recipe objects
+	__slots__ = ("_lazy",)
+
 	def __init__(self, recipe_list):
 		for r in recipe_list :
 			assert isinstance(r, Recipe), (r,)
 		
 		super().__init__(recipe_list)
 
-	def makefile(self):
-		# newline separated, tab prefixed
-		s = ""
-		if len(self.token_list):
-			s = "\t" + "\n\t".join([t.makefile() for t in self.token_list])
-			s += "\n"
-		return s
+	def fragments(self):
+		# newline terminated, tab prefixed
+		for t in self.token_list:
+			yield "\t"
+			yield from t.fragments()
+			yield "\n"
 
 class Directive(Symbol):
 	name = "should not see this"
+	__slots__ = ("expression", "code")
 
 	# A Directive instance contains an Expression instance ("has a").
 	# A Directive instance is _not_ an Expression instance ("not is-a").
@@ -384,8 +585,29 @@ class Directive(Symbol):
 		if expression : 
 			assert isinstance(expression, Expression) 
 
-		super().__init__()
 		self.expression = expression
+		super().__init__()
+
+	def _structural_hash(self):
+		return hash((self._class_hash, self.expression._hash if self.expression else 0))
+
+	def __hash__(self):
+		return self._hash
+
+	def __eq__(self, rhs):
+		# string is None so compare the expression (the hash is only a
+		# shortcut; it's a crc)
+		if not isinstance(rhs, Symbol):
+			return Symbol.__eq__(self, rhs)
+		if self._hash != rhs._hash or self.__class__ is not rhs.__class__:
+			return False
+		if self.expression is None or rhs.expression is None:
+			return self.expression is rhs.expression
+		return self.expression == rhs.expression
+
+	def set_code(self, vline):
+		# the VirtualLine holding the directive (for error reporting)
+		self.code = vline
 
 	def __str__(self):
 		if self.expression : 
@@ -393,14 +615,15 @@ class Directive(Symbol):
 		else:
 			return "{0}()".format(self.__class__.__name__)
 
-	def makefile(self):
+	def fragments(self):
+		yield self.name
 		if self.expression : 
-			return "{0} {1}".format(self.name, self.expression.makefile() )
-		else : 
-			return "{0}".format(self.name)
+			yield " "
+			yield from self.expression.fragments()
 
 class ExportDirective(Directive):
 	name = "export"
+	__slots__ = ()
 
 	def __init__(self, expression=None):
 		# TODO 
@@ -414,23 +637,29 @@ class ExportDirective(Directive):
 
 class UnExportDirective(ExportDirective):
 	name = "unexport"
+	__slots__ = ()
 
 class IncludeDirective(Directive):
 	name = "include"
+	__slots__ = ()
 
 class MinusIncludeDirective(IncludeDirective):
 	# handles -include directives
 	name = "-include"
+	__slots__ = ()
 
 class SIncludeDirective(MinusIncludeDirective):
 	# handles sinclude directives (another name for -include)
 	name = "sinclude"
+	__slots__ = ()
 
 class VpathDirective(Directive):
 	name = "vpath"
+	__slots__ = ()
 
 class OverrideDirective(Directive):
 	name = "override"
+	__slots__ = ()
 
 	def __init__(self, expression=None ):
 		description="Override requires an assignment expression."
@@ -443,7 +672,10 @@ class OverrideDirective(Directive):
 
 		super().__init__(expression)
 
-class LineBlock(Symbol):
+	def eval(self, symbol_table):
+		return self.expression.eval(symbol_table, "override")
+
+class LineBlock(Symbol, LazyLoad):
 	# Pile of unparsed code inside a conditional directive or a define
 	# multi-line macro. The text is unexamined until the condition is evaluated
 	# true (for conditional) or until the macro is $(call)ed (for multi-line
@@ -460,22 +692,98 @@ class LineBlock(Symbol):
 	# define foo
 	#   LineBlock
 	# endef
+	#
+	# Most of these blocks are never evaluated so only the raw physical lines
+	# are kept (not VirtualLines with a VChar per character), plus where each
+	# of the original VirtualLines started: starts is a tuple of
+	# (starting file line, number of physical lines).
+	#
+	# The statements are parsed on first use of statements() and kept.
+	__slots__ = ("filename", "phys_lines", "starts", "_statements", "_lazy")
 
 	def __init__(self, vline_list):
 		VirtualLine.validate(vline_list)
-		self.vline_list = vline_list
+		self.filename = vline_list[0].filename if vline_list else None
+		phys_lines = []
+		starts = []
+		for v in vline_list:
+			phys_lines.extend(v.phys_lines)
+			starts.append((v.starting_file_line, len(v.phys_lines)))
+		self.phys_lines = tuple(phys_lines)
+		self.starts = tuple(starts)
 		super().__init__()
 
-	def makefile(self):
-		VirtualLine.validate(self.vline_list)
-		
-		s = "".join( [ str(v) for v in self.vline_list ] )
-		return s
+	def _structural_hash(self):
+		return hash((self._class_hash, text_hash("".join(self.phys_lines))))
+
+	def __hash__(self):
+		return self._hash
+
+	def __eq__(self, rhs):
+		# same text (two texts can have the same crc)
+		if not isinstance(rhs, Symbol):
+			return Symbol.__eq__(self, rhs)
+		if self._hash != rhs._hash or self.__class__ is not rhs.__class__:
+			return False
+		return self.phys_lines == rhs.phys_lines
+
+	def vlines(self):
+		# rebuild the VirtualLine instances
+		idx = 0
+		for start, count in self.starts:
+			yield VirtualLine(list(self.phys_lines[idx:idx+count]), start, self.filename)
+			idx += count
+
+	def fragments(self):
+		for v in self.vlines():
+			yield str(v)
+
+	def first_line(self):
+		# line number of the first line
+		return self.starts[0][0] if self.starts else 0
+
+	def source_lines(self):
+		# The physical lines from first_line() on, with empty lines where
+		# lines were dropped (blank lines, comments) so every line lands on
+		# its original line number when parsed.
+		first = self.first_line()
+		lines = []
+		idx = 0
+		for start, count in self.starts:
+			if start-first > len(lines):
+				lines.extend(["\n"] * (start-first-len(lines)))
+			lines.extend(self.phys_lines[idx:idx+count])
+			idx += count
+		return lines
+
+	def is_parsed(self):
+		try:
+			self._statements
+		except AttributeError:
+			return False
+		return True
+
+	def statements(self):
+		# the parsed contents (list of statements); parsed once
+		try:
+			return self._statements
+		except AttributeError:
+			pass
+
+		# (imported here; pymake imports this module)
+		import pymake
+		import source
+
+		logger.debug("parse LineBlock filename=%s lines=%d", self.filename, len(self.phys_lines))
+		src = source.SourceLines(self.source_lines(), self.filename or "/dev/null",
+								 self.first_line())
+		self._statements = pymake.parse_makefile_from_src(src).token_list
+		return self._statements
 
 	def __str__(self):
 		# This class contains an array of VirtualLine instances. Need to
 		# recreate the appropriate Python code.
-		s = ", ".join( [v.python() for v in self.vline_list] )
+		s = ", ".join( [v.python() for v in self.vlines()] )
 		return "LineBlock([{0}])".format(s)
 
 class ConditionalBlock(Directive):
@@ -484,6 +792,10 @@ class ConditionalBlock(Directive):
 	# A ConditionalBlock represents a conditional and all its contents
 	# (if/elseif/else/endif). 
 	#
+	# Note: cond_exprs/cond_blocks stay lists; the parser builds a
+	# ConditionalBlock incrementally. So its structural hash only covers the
+	# class.
+	#
 	# A ConditionalDirective instance is the conditional expression (ifdef
 	# Expression, ifndef Expression, etc).
 	#
@@ -513,6 +825,13 @@ class ConditionalBlock(Directive):
 	# The stuff inside the cond_blocks[] is {LineBlock|ConditionalBlock}
 	# Is an array of unparsed text (LineBlock) intermixed with more nested
 	# conditionals (ConditionalBlock).
+	#
+	# The branch taken is remembered along with the versions of the
+	# variables the conditions read (see SymbolTable.begin_watch()). If none
+	# changed, the next eval (e.g., the makefile included again) takes the
+	# same branch without evaluating the conditions. Branch bodies are
+	# parsed once by LineBlock.statements().
+	__slots__ = ("cond_exprs", "cond_blocks", "_selection")
 
 	def __init__(self, conditional_blocks=None, else_blocks=None ) :
 		super().__init__()
@@ -552,6 +871,17 @@ class ConditionalBlock(Directive):
 			for b in else_blocks: 
 				self.add_block( b )
 		
+	def __hash__(self):
+		return self._hash
+
+	def __eq__(self, rhs):
+		# the hash is only the class so compare the conditions and blocks
+		if not isinstance(rhs, Symbol):
+			return Symbol.__eq__(self, rhs)
+		if self.__class__ is not rhs.__class__:
+			return False
+		return self.cond_exprs == rhs.cond_exprs and self.cond_blocks == rhs.cond_blocks
+
 	def add_conditional( self, cond_expr ) :
 		assert len(self.cond_exprs) == len(self.cond_blocks)
 		assert isinstance(cond_expr, ConditionalDirective), (type(cond_expr), )
@@ -567,34 +897,75 @@ class ConditionalBlock(Directive):
 		self.cond_blocks.append( [] )
 		assert len(self.cond_exprs)+1 == len(self.cond_blocks)
 
-	def makefile(self):
+	def select(self, symbol_table):
+		# the list of blocks of the branch taken
+		try:
+			watch, idx = self._selection
+		except AttributeError:
+			pass
+		else:
+			if symbol_table.unchanged(watch):
+				logger.debug("conditional reuse branch=%s", idx)
+				return self.cond_blocks[idx] if idx is not None else ()
+
+		frame = symbol_table.begin_watch()
+		try:
+			idx = None
+			for n, expr in enumerate(self.cond_exprs):
+				if expr.is_true(symbol_table):
+					idx = n
+					break
+			else:
+				if len(self.cond_blocks) > len(self.cond_exprs):
+					idx = len(self.cond_exprs)
+		finally:
+			watch = symbol_table.end_watch(frame)
+
+		if watch is not None:
+			self._selection = (watch, idx)
+		else:
+			# read something that can't be tracked e.g., $(shell)
+			self._selection = (None, None)
+		logger.debug("conditional branch=%s", idx)
+		return self.cond_blocks[idx] if idx is not None else ()
+
+	def eval(self, symbol_table):
+		for block in self.select(symbol_table):
+			if isinstance(block, LineBlock):
+				for statement in block.statements():
+					statement.eval(symbol_table)
+			else:
+				block.eval(symbol_table)
+		return None
+
+	def fragments(self):
 		# sanity check; need at least one conditional
 		assert self.cond_exprs
 
-		s = ""
 		e = ""
 		
 		# jump through weird hoop to add tailing \n on ConditionalBlock sub-blocks
 		# (my rule is the final \n is caller's responsibility)
-		def prn(b):
-			if isinstance(b, ConditionalBlock) :
-				return b.makefile()+"\n"
-			else:
-				return b.makefile()
+		def prn(block):
+			for b in block:
+				yield from b.fragments()
+				if isinstance(b, ConditionalBlock) :
+					yield "\n"
 
 		# if/elseif blocks
 		for expr, block in zip(self.cond_exprs, self.cond_blocks):
-			s += e + expr.makefile()+"\n"
-			s += "".join([prn(b) for b in block])
+			yield e
+			yield from expr.fragments()
+			yield "\n"
+			yield from prn(block)
 			e = "else "
 		# else block
 		if len(self.cond_exprs) != len(self.cond_blocks) :
 			assert len(self.cond_exprs)+1 == len(self.cond_blocks)
-			s += "else\n"
-			s += "".join([prn(b) for b in self.cond_blocks[-1]])
+			yield "else\n"
+			yield from prn(self.cond_blocks[-1])
 			
-		s += "endif"
-		return s
+		yield "endif"
 
 	def __str__(self):
 		s = "{0}(".format(self.__class__.__name__)
@@ -622,28 +993,152 @@ class ConditionalBlock(Directive):
 
 class ConditionalDirective(Directive):
 	name = "(should not see this)"
+	__slots__ = ()
+
+	def is_true(self, symbol_table):
+		# children should override
+		assert 0
+
+	def syntax_error(self):
+		vline = getattr(self, "code", None)
+		return EvalError(description="invalid syntax in conditional", vline=vline,
+						 filename=vline.filename if vline else None)
 	
 class IfdefDirective(ConditionalDirective):
 	name = "ifdef"
+	__slots__ = ()
+
+	def is_true(self, symbol_table):
+		# true if the variable has a (non-empty) value; the value isn't
+		# expanded
+		name = self.expression.eval(symbol_table).strip()
+		if not name:
+			raise self.syntax_error()
+		return symbol_table.defined(name)
 
 class IfndefDirective(ConditionalDirective):
 	name = "ifndef"
+	__slots__ = ()
+
+	def is_true(self, symbol_table):
+		return not IfdefDirective.is_true(self, symbol_table)
 
 class IfeqDirective(ConditionalDirective):
 	name = "ifeq"
+	__slots__ = ()
+
+	def args(self, symbol_table):
+		# The two expanded strings of ifeq (a,b) or ifeq "a" "b" (or 'a').
+		# The separators are only found in the literal text; commas, quotes
+		# and parens from a variable's value are just more text.
+		# (the raw text; Literal.eval() escapes quotes)
+		stream = []
+		for t in self.expression.token_list:
+			if isinstance(t, Literal):
+				if t.string:
+					stream.extend(str(t.string))
+			else:
+				stream.append(t)
+
+		def is_str(item):
+			return isinstance(item, str)
+
+		# skip leading whitespace
+		idx = 0
+		while idx < len(stream) and is_str(stream[idx]) and stream[idx] in " \t":
+			idx += 1
+		if idx==len(stream) or not is_str(stream[idx]):
+			raise self.syntax_error()
+
+		args = ([], [])
+		n = 0
+		c = stream[idx]
+		rest = stream[idx+1:]
+		if c=="(":
+			depth = 0
+			for pos, item in enumerate(rest):
+				if is_str(item):
+					if item=="(":
+						depth += 1
+					elif item==")":
+						if depth==0:
+							break
+						depth -= 1
+					elif item=="," and depth==0 and n==0:
+						n = 1
+						continue
+				args[n].append(item)
+			else:
+				# no closing paren
+				raise self.syntax_error()
+			if n==0 or any(not is_str(item) or item not in " \t" for item in rest[pos+1:]):
+				raise self.syntax_error()
+			# blanks are stripped after the first string and before the second
+			while args[0] and is_str(args[0][-1]) and args[0][-1] in " \t":
+				args[0].pop()
+			while args[1] and is_str(args[1][0]) and args[1][0] in " \t":
+				args[1].pop(0)
+		elif c in "\"'":
+			quote = c
+			for item in rest:
+				if quote:
+					if is_str(item) and item==quote:
+						quote = None
+						n += 1
+					else:
+						args[n].append(item)
+				elif is_str(item) and item in " \t":
+					continue
+				elif n==1 and is_str(item) and item in "\"'":
+					quote = item
+				else:
+					raise self.syntax_error()
+			if n != 2:
+				raise self.syntax_error()
+		else:
+			raise self.syntax_error()
+
+		return tuple("".join([item if is_str(item) else item.eval(symbol_table) for item in arg])
+						for arg in args)
+
+	def is_true(self, symbol_table):
+		lhs, rhs = self.args(symbol_table)
+		logger.debug("%s \"%s\" \"%s\"", self.name, lhs, rhs)
+		return lhs==rhs
 
 class IfneqDirective(ConditionalDirective):
 	name = "ifneq"
+	__slots__ = ()
+
+	def is_true(self, symbol_table):
+		lhs, rhs = IfeqDirective.args(self, symbol_table)
+		logger.debug("%s \"%s\" \"%s\"", self.name, lhs, rhs)
+		return lhs!=rhs
 
 class DefineDirective(Directive):
 	name = "define"
+	__slots__ = ("line_block",)
 
 	def __init__(self, macro_name, line_block=None):
+		assert isinstance(macro_name, str), type(macro_name)
+		self.line_block = line_block if line_block else LineBlock([])
+
 		super().__init__()
 		self.string = macro_name
-		assert isinstance(macro_name, str), type(macro_name)
+		self._hash = self._structural_hash()
 
-		self.line_block = line_block if line_block else LineBlock([])
+	def _structural_hash(self):
+		return hash((self._class_hash, text_hash(self.string or ""), self.line_block._hash))
+
+	def __hash__(self):
+		return self._hash
+
+	def __eq__(self, rhs):
+		if not isinstance(rhs, Symbol):
+			return Symbol.__eq__(self, rhs)
+		if self._hash != rhs._hash or self.__class__ is not rhs.__class__:
+			return False
+		return self.string == rhs.string and self.line_block == rhs.line_block
 
 	def __str__(self):
 		return "{0}(\"{1}\", {2})".format(self.__class__.__name__,
@@ -652,28 +1147,147 @@ class DefineDirective(Directive):
 
 	def set_block(self, line_block):
 		self.line_block = line_block
+		self._hash = self._structural_hash()
 
-	def makefile(self):
-		return "define {0}\n{1}endef".format(
-						self.string,
-						self.line_block.makefile() )
+	def fragments(self):
+		yield "define {0}\n".format(self.string)
+		yield from self.line_block.fragments()
+		yield "endef"
 		
 
+def static_name(expr):
+	# The text of a variable or target name that's all Literals ("CFLAGS").
+	# Returns None for a computed name ("$(prefix)FLAGS").
+	if isinstance(expr, Literal):
+		return str(expr.string).strip()
+	if not isinstance(expr, Expression):
+		return None
+	s = ""
+	for t in expr.token_list:
+		if not isinstance(t, Literal):
+			return None
+		s += str(t.string)
+	return s.strip()
+
 class Makefile(object) : 
 	# A collection of statements, directives, rules.
 	# Note this class is separate from the Symbol hierarchy.
+	#
+	# Queries (find(), assignments(), rules(), directives()) use indexes built
+	# on first use and cached in _index. Call invalidate() after modifying
+	# token_list. The indexes cover every branch of every conditional, taken
+	# or not (the branches are parsed when the index is built) so an answer
+	# doesn't depend on what's been evaluated.
+	__slots__ = ("token_list", "_index")
 
 	def __init__(self, token_list):
-		Symbol.validate(token_list)
+		if checked:
+			Symbol.validate(token_list)
 		self.token_list = token_list
+		self._index = None
+
+	def invalidate(self):
+		self._index = None
+
+	def _get_index(self):
+		# Makefile instances from serialize.py don't go through __init__
+		index = getattr(self, "_index", None)
+		if index is None:
+			index = self._build_index()
+			self._index = index
+		return index
+
+	def _build_index(self):
+		# (imported here; walker imports this module)
+		import walker
+
+		by_class = {}
+		by_var = {}
+		by_target = {}
+		by_directive = {}
+
+		def add(node):
+			# every Symbol class in the MRO so find(Directive) finds all
+			# directives
+			for klass in node.__class__.__mro__:
+				if klass is Symbol:
+					break
+				by_class.setdefault(klass, []).append(node)
+
+			if isinstance(node, AssignmentExpression):
+				name = static_name(node.token_list[0])
+				if name is not None:
+					by_var.setdefault(names.intern(name), []).append(node)
+			elif isinstance(node, RuleExpression):
+				for t in node.token_list[0].token_list:
+					name = static_name(t)
+					if name is not None:
+						by_target.setdefault(names.intern(name), []).append(node)
+			elif isinstance(node, Directive) and not isinstance(node, ConditionalBlock):
+				by_directive.setdefault(node.name, []).append(node)
+				# override/export an assignment
+				if isinstance(node.expression, AssignmentExpression):
+					add(node.expression)
+
+		class Indexer(object):
+			# statements only; don't descend into expressions or define bodies
+			def enter(self, node):
+				if isinstance(node, Makefile):
+					return None
+				add(node)
+				if isinstance(node, LineBlock):
+					return None if walker.parse_branch(node) else walker.PRUNE
+				if isinstance(node, ConditionalBlock):
+					return None
+				return walker.PRUNE
+
+			def leave(self, node):
+				pass
+
+		walker.walk(self, Indexer())
+
+		logger.debug("index classes=%d vars=%d targets=%d directives=%d",
+				len(by_class), len(by_var), len(by_target), len(by_directive))
+		return by_class, by_var, by_target, by_directive
+
+	def find(self, cls):
+		# all statements (and nested conditional contents) that are instances
+		# of cls, in source order
+		return self._get_index()[0].get(cls, [])
+
+	def assignments(self, name):
+		# all assignments to variable 'name' (including override/export)
+		return self._get_index()[1].get(name, [])
+
+	def rules(self, target):
+		# all rules with 'target' among their targets
+		return self._get_index()[2].get(target, [])
+
+	def directives(self, name):
+		# all directives by name, e.g., "include", "vpath", "ifdef"
+		return self._get_index()[3].get(name, [])
 
 	def __str__(self):
 		return "Makefile([{0}])".format(", \n".join( [ str(block) for block in self.token_list ] ) )
 #		return "Makefile([{0}])".format(", \n".join( [ "{0}".format(block) for block in self.token_list ] ) )
 
 	def makefile(self):
-		s = "\n".join( [ "{0}".format(token.makefile()) for token in self.token_list ] )
-		return s
+		return "".join(self.fragments())
+
+	def fragments(self):
+		# statements are newline separated
+		sep = ""
+		for token in self.token_list:
+			yield sep
+			yield from token.fragments()
+			sep = "\n"
+
+	def write(self, outfile):
+		# Stream the regenerated makefile to outfile (anything with a write()
+		# method) without building the whole text in memory.
+		for s in self.fragments():
+			if s:
+				outfile.write(s)
 
 	def __iter__(self):
 		return iter(self.token_list)
@@ -1,24 +1,698 @@
 # davep 20-Mar-2016 ; symbol table
 
 import os
+import itertools
 import logging
 
 logger = logging.getLogger("pymake.symtable")
 
+import nametable
+import walker
+from symbol import Expression, Literal
+from vline import VCharString
+from error import RecursiveVariable
+
+# automatic variables; their values change per rule so expansions reading
+# them are never cached
+automatic_variables = { "@", "%", "<", "?", "^", "+", "|", "*",
+						"@D", "@F", "%D", "%F", "<D", "<F", "?D", "?F",
+						"^D", "^F", "+D", "+F", "*D", "*F" }
+
+# $(origin) values
+ORIGIN_UNDEFINED = "undefined"
+ORIGIN_DEFAULT = "default"
+ORIGIN_ENVIRONMENT = "environment"
+ORIGIN_FILE = "file"
+ORIGIN_COMMAND_LINE = "command line"
+ORIGIN_OVERRIDE = "override"
+ORIGIN_AUTOMATIC = "automatic"
+
+# $(flavor) values
+FLAVOR_UNDEFINED = "undefined"
+FLAVOR_RECURSIVE = "recursive"
+FLAVOR_SIMPLE = "simple"
+
 class DuplicateFunction(Exception):
 	pass
 
+class Variable(object):
+	# A variable's value plus where it came from ($(origin)) and how it's
+	# expanded ($(flavor)). A recursively expanded value is an Expression,
+	# a simply expanded value is a string.
+	#
+	# Appends (+=) are kept as a list of fragments (strings for a simple
+	# variable, Symbols for a recursive one, separators included) and only
+	# joined when the value is read. The joined value is cached until the
+	# next append so building a long list one += at a time is linear.
+	#
+	# A target-specific += (foo : CFLAGS += -O0) has inherit set: its value
+	# is only the appended text, added to whatever the target inherits when
+	# it's read (see SymbolTable.lookup()). parent is the Variable of the
+	# outer scope it appends to, None for the global one.
+	__slots__ = ("name", "_value", "origin", "flavor", "appends", "_flat",
+				 "inherit", "parent")
+
+	def __init__(self, name, value, origin=ORIGIN_FILE, flavor=None):
+		self.name = name
+		self._value = value
+		self.origin = origin
+		if flavor is None:
+			flavor = FLAVOR_RECURSIVE if isinstance(value, Expression) else FLAVOR_SIMPLE
+		self.flavor = flavor
+		self.appends = None
+		self._flat = None
+		self.inherit = False
+		self.parent = None
+
+	@property
+	def value(self):
+		if self.appends is None:
+			return self._value
+		if self._flat is None:
+			self._flat = self._flatten()
+		return self._flat
+
+	def _flatten(self):
+		logger.debug("flatten %s appends=%d", self.name, len(self.appends))
+		if self.flavor==FLAVOR_SIMPLE:
+			return "".join([self._value] + self.appends)
+		base = self._value
+		if not isinstance(base, Expression):
+			# e.g., an environment variable
+			base = Literal(VCharString.from_string(base))
+		return Expression([base] + self.appends)
+
+	def append(self, value):
+		# value is a string for a simple variable else an Expression
+		empty = _blank(value)
+		if self.appends is None:
+			if _blank(self._value):
+				# appending to an empty value is an assignment
+				if not empty:
+					self._value = value
+				return
+			self.appends = []
+		# (appends is only started on a non-empty value)
+		self.appends.append(" " if self.flavor==FLAVOR_SIMPLE else _space)
+		self.appends.append(value)
+		self._flat = None
+
+	def copy(self, origin=None):
+		var = Variable(self.name, self._value, origin or self.origin, self.flavor)
+		if self.appends is not None:
+			var.appends = list(self.appends)
+		var.inherit = self.inherit
+		var.parent = self.parent
+		return var
+
+def _blank(value):
+	# the (unexpanded) text of a value is empty
+	return not (value if isinstance(value, str) else value.makefile())
+
+def _first_pos(node):
+	# filename, (row, col) of the first visible char under node
+	for t in walker.iter_nodes(node):
+		if isinstance(t, Expression) or not isinstance(t.string, VCharString):
+			continue
+		for vchar in t.string:
+			if not vchar.hide:
+				return vchar.filename, vchar.pos
+	return None, None
+
+# separator of recursive appends
+_space = Literal(VCharString.from_string(" "))
+
+# shared by layers without variables of their own
+_empty = {}
+
+class Scope(object):
+	# A layer of target-specific, pattern-specific or automatic variables
+	# over the global table. Layers chain to their parent: a target's scope
+	# sits on its matching patterns' scopes, which sit on the scope of the
+	# target that asked for it (so prerequisites inherit along the chain).
+	#
+	# view() flattens the chain, never including the global table, and a
+	# layer without variables of its own shares its parent's view, so 50,000
+	# targets don't get 50,000 copies of anything. Layer dicts are never
+	# modified once a Scope holds them (SymbolTable copies on write).
+	__slots__ = ("name", "layer", "parent", "_view", "cache", "dependents", "generation")
+
+	def __init__(self, name, layer, parent=None):
+		self.name = name
+		self.layer = layer
+		self.parent = parent
+		self._view = None
+
+		# expansions memoized within this scope (see SymbolTable.expand)
+		self.cache = {}
+		self.dependents = {}
+		# SymbolTable.generation when the cache was last known good
+		self.generation = -1
+
+	def view(self):
+		# name -> Variable for every layer in the chain
+		if self._view is None:
+			base = self.parent.view() if self.parent is not None else _empty
+			if not self.layer:
+				self._view = base
+			elif not base:
+				self._view = self.layer
+			else:
+				view = dict(base)
+				for name, var in self.layer.items():
+					if var.inherit and name in base:
+						# += appends to our parent's value (the layer's
+						# Variable is shared so isn't touched)
+						var = var.copy()
+						var.parent = base[name]
+					view[name] = var
+				self._view = view
+		return self._view
+
+def _pattern_stem(pattern, target):
+	# length of the stem if target matches pattern (e.g., %.o) else -1
+	prefix, suffix = pattern.split("%", 1)
+	if len(target) < len(prefix) + len(suffix):
+		return -1
+	if not target.startswith(prefix) or not target.endswith(suffix):
+		return -1
+	return len(target) - len(prefix) - len(suffix)
+
+# every SymbolTable gets a different serial (see begin_watch())
+_serials = itertools.count(1)
+
 class SymbolTable(object):
-	def __init__(self):
+	# environ - the environment to use (default os.environ). A copy is taken
+	#	once; the process environment is never read again.
+	def __init__(self, names=None, environ=None):
+		# name -> Variable
 		self.symbols = {}
 
-	def add(self, name, value):
+		# Keys are interned so lookups with names from the AST (also interned,
+		# see Literal.eval) hit the dict's identity fast path.
+		self.names = names if names is not None else nametable.names
+
+		# Expansions of recursively expanded variables are memoized.
+		#	name -> (value, frozenset of names the expansion read)
+		self.cache = {}
+		# name -> names of cached expansions that read it
+		self.dependents = {}
+		# one frame [names read, impure, name] per expansion in progress
+		self.frames = []
+		# names of the expansions in progress (a name found here again is
+		# a variable that references itself)
+		self.expanding = set()
+		# names that must never be cached (e.g., loop variables); see also
+		# is_volatile()
+		self.volatile = set()
+		# one (name, arg1, ... argN) per $(call) in progress; $0..$N
+		self.call_frames = []
+		# name -> Variable of the $(foreach) loop variables in progress;
+		# looked at before anything else
+		self.loop_vars = {}
+
+		# Snapshot of the environment, a layer under self.symbols.
+		# Environment variables are recursively expanded in GNU Make (the
+		# value is still kept as the plain string).
+		if environ is None:
+			environ = os.environ
+		self.environment = {}
+		for name, value in environ.items():
+			if name:
+				name = self.names.intern(name)
+				self.environment[name] = Variable(name, value, ORIGIN_ENVIRONMENT, FLAVOR_RECURSIVE)
+
+		# negative cache; names known to be in neither layer
+		self.undefined = set()
+
+		# target -> { name : Variable } of target-specific variables
+		self.target_vars = {}
+		# [ (pattern, { name : Variable }), ... ] in makefile order
+		self.pattern_vars = []
+		# (target or pattern, parent Scope) -> Scope
+		self.scopes = {}
+		# active scopes; lookups check the top one's view() first
+		self.scope_stack = []
+		self.view = None
+		# the global table's expansion cache while a scope is active
+		self.global_cache = self.cache
+		self.global_dependents = self.dependents
+		# bumped by every global assignment; stale scope caches are dropped
+		# when their scope is (re)activated
+		self.generation = 0
+
+		# name -> generation of its last change
+		self.versions = {}
+		self.serial = next(_serials)
+
+		# target-specific += Variable -> (version of its name, the Variable
+		# it resolved to); see _resolve()
+		self.resolved = {}
+
+	def add(self, name, value, origin=ORIGIN_FILE):
 		logger.debug("%s store \"%s\"=\"%s\"", self, name, value)
 
 		# an attempt to store empty string is a bug
 		assert len(name)
 
-		self.symbols[name] = value
+		name = self.names.intern(name)
+
+		# the makefile can't change command line or override variables
+		# (unless it's an override itself)
+		var = self.symbols.get(name)
+		if var is not None and var.origin in (ORIGIN_COMMAND_LINE, ORIGIN_OVERRIDE) \
+				and origin not in (ORIGIN_COMMAND_LINE, ORIGIN_OVERRIDE):
+			logger.debug("%s not replacing %s variable %s", self, var.origin, name)
+			return
+
+		self.symbols[name] = Variable(name, value, origin)
+		self._changed(name)
+
+	def append(self, name, value, origin=ORIGIN_FILE):
+		# name += value where value is the (unexpanded) RHS Expression
+		logger.debug("%s append \"%s\"+=\"%s\"", self, name, value)
+		assert len(name)
+
+		name = self.names.intern(name)
+		var = self.symbols.get(name)
+		if var is None:
+			env = self.environment.get(name)
+			if env is None:
+				# += on an undefined variable is a recursive assignment
+				self.add(name, value, origin)
+				return
+			# the makefile's copy of an environment variable
+			var = self.symbols[name] = env.copy(origin)
+		elif var.origin in (ORIGIN_COMMAND_LINE, ORIGIN_OVERRIDE) \
+				and origin not in (ORIGIN_COMMAND_LINE, ORIGIN_OVERRIDE):
+			logger.debug("%s not appending %s variable %s", self, var.origin, name)
+			return
+
+		if var.flavor==FLAVOR_SIMPLE:
+			value = value.eval(self)
+		var.append(value)
+		if origin==ORIGIN_OVERRIDE:
+			var.origin = origin
+		self._changed(name)
+
+	def _changed(self, name):
+		self.undefined.discard(name)
+		self.generation += 1
+		self.versions[name] = self.generation
+		self.invalidate(name)
+		if self.scope_stack:
+			self._invalidate(self.global_cache, self.global_dependents, name)
+			self.scope_stack[-1].generation = self.generation
+
+	def add_specific(self, targets, name, value, origin=ORIGIN_FILE, append=False):
+		# target-specific (or, for a target with a %, pattern-specific)
+		# assignment, e.g., foo.o : CFLAGS=-O0
+		# append - += (value is the unexpanded RHS Expression)
+		logger.debug("%s store %s \"%s\"=\"%s\"", self, targets, name, value)
+		assert len(name)
+
+		name = self.names.intern(name)
+		var = Variable(name, value, origin)
+		for target in targets:
+			if append:
+				var = self._append_specific(target, name, value, origin)
+			target = self.names.intern(target)
+			if "%" in target:
+				for idx, (pattern, layer) in enumerate(self.pattern_vars):
+					if pattern==target:
+						# copy on write; existing scopes keep the old layer
+						layer = dict(layer)
+						layer[name] = var
+						self.pattern_vars[idx] = (pattern, layer)
+						break
+				else:
+					self.pattern_vars.append((target, {name : var}))
+			else:
+				layer = dict(self.target_vars.get(target, _empty))
+				layer[name] = var
+				self.target_vars[target] = layer
+
+		# scopes are rebuilt on next use
+		self.scopes.clear()
+		self.resolved.clear()
+
+	def _append_specific(self, target, name, value, origin):
+		# The Variable for target's name += value. Appends to the target's
+		# own variable, else to whatever the target inherits when it's read.
+		if "%" in target:
+			layer = dict(self.pattern_vars).get(target, _empty)
+		else:
+			layer = self.target_vars.get(target, _empty)
+		var = layer.get(name)
+		if var is None:
+			var = Variable(name, value, origin, FLAVOR_RECURSIVE)
+			var.inherit = True
+			return var
+		# copy; the old Variable is still in other layers and views
+		var = var.copy(origin)
+		var.append(value.eval(self) if var.flavor==FLAVOR_SIMPLE else value)
+		return var
+
+	def target_scope(self, target, parent=None):
+		# The Scope of target's variables. parent is the scope of the target
+		# that has target as a prerequisite (None for a goal).
+		key = (target, parent)
+		try:
+			return self.scopes[key]
+		except KeyError:
+			pass
+
+		# pattern-specific variables; shorter stems are more specific so are
+		# layered on top
+		matches = []
+		for pattern, layer in self.pattern_vars:
+			stem = _pattern_stem(pattern, target)
+			if stem >= 0:
+				matches.append((stem, pattern, layer))
+		matches.sort(key=lambda m: -m[0])
+
+		scope = parent
+		for stem, pattern, layer in matches:
+			pkey = (pattern, scope)
+			try:
+				scope = self.scopes[pkey]
+			except KeyError:
+				scope = self.scopes[pkey] = Scope(pattern, layer, scope)
+
+		scope = Scope(target, self.target_vars.get(target, _empty), scope)
+		self.scopes[key] = scope
+		return scope
+
+	def automatic_scope(self, scope, values):
+		# the automatic variables ($@, $<, ...) of one rule over scope
+		layer = { self.names.intern(name) : Variable(name, value, ORIGIN_AUTOMATIC)
+					for name, value in values.items() }
+		return Scope("automatic", layer, scope)
+
+	def push_scope(self, scope):
+		self.scope_stack.append(scope)
+		self._use(scope)
+
+	def pop_scope(self):
+		self.scope_stack.pop()
+		self._use(self.scope_stack[-1] if self.scope_stack else None)
+
+	def _use(self, scope):
+		if scope is None:
+			self.view = None
+			self.cache = self.global_cache
+			self.dependents = self.global_dependents
+			return
+		if scope.generation != self.generation:
+			scope.cache.clear()
+			scope.dependents.clear()
+			scope.generation = self.generation
+		self.view = scope.view()
+		self.cache = scope.cache
+		self.dependents = scope.dependents
+
+	def lookup(self, name):
+		# the Variable for name or None
+		if self.loop_vars:
+			var = self.loop_vars.get(name)
+			if var is not None:
+				return var
+		if self.view:
+			var = self.view.get(name)
+			if var is not None:
+				if var.origin==ORIGIN_OVERRIDE:
+					return self._resolve(var) if var.inherit else var
+				# command line and override variables beat target-specific
+				glob = self.symbols.get(name)
+				if glob is None or glob.origin not in (ORIGIN_COMMAND_LINE, ORIGIN_OVERRIDE):
+					return self._resolve(var) if var.inherit else var
+		var = self.symbols.get(name)
+		if var is not None:
+			return var
+		if name in self.undefined:
+			return None
+		var = self.environment.get(name)
+		if var is None:
+			self.undefined.add(name)
+		return var
+
+	def _resolve(self, var):
+		# The Variable of a target-specific += appended to what it inherits:
+		# the outer scope's Variable or the global one (as it is now). Like
+		# GNU Make the result is recursively expanded (a simple inherited
+		# value is used as literal text).
+		name = var.name
+		version = self.versions.get(name, 0)
+		hit = self.resolved.get(var)
+		if hit is not None and hit[0]==version:
+			return hit[1]
+
+		parent = self._inherited(var)
+		if parent is None:
+			# nothing to append to
+			resolved = Variable(name, var.value, var.origin, FLAVOR_RECURSIVE)
+		else:
+			resolved = Variable(name, parent.value, var.origin, FLAVOR_RECURSIVE)
+			resolved.append(var.value)
+		self.resolved[var] = (version, resolved)
+		return resolved
+
+	def _inherited(self, var):
+		parent = var.parent
+		if parent is None:
+			parent = self.symbols.get(var.name)
+			if parent is None:
+				parent = self.environment.get(var.name)
+			return parent
+		return self._resolve(parent) if parent.inherit else parent
+
+	def origin(self, name):
+		if self.frames:
+			self.frames[-1][0].add(name)
+		var = self.lookup(name)
+		return var.origin if var is not None else ORIGIN_UNDEFINED
+
+	def flavor(self, name):
+		if self.frames:
+			self.frames[-1][0].add(name)
+		var = self.lookup(name)
+		return var.flavor if var is not None else FLAVOR_UNDEFINED
+
+	def invalidate(self, name):
+		# forget the cached expansions of name and of everything that read
+		# name (dependencies are recorded transitively so one level is enough)
+		self._invalidate(self.cache, self.dependents, name)
+
+	def _invalidate(self, cache, dependents, name):
+		cache.pop(name, None)
+		for dependent in dependents.pop(name, ()):
+			logger.debug("invalidate %s (read %s)", dependent, name)
+			cache.pop(dependent, None)
+
+	def is_volatile(self, name):
+		return name in automatic_variables or name.isdigit() or name in self.volatile
+
+	def defined(self, name):
+		# ifdef; the variable has a non-empty value (which isn't expanded)
+		if self.frames:
+			self.frames[-1][0].add(name)
+		var = self.lookup(name)
+		return var is not None and not _blank(var.value)
+
+	def begin_watch(self):
+		# Start recording the names read (like an expansion in progress).
+		# end_watch() returns something unchanged() can check later.
+		frame = [set(), False, None]
+		self.frames.append(frame)
+		return frame
+
+	def end_watch(self, frame):
+		# None if what was read can't be tracked
+		assert self.frames[-1] is frame
+		self.frames.pop()
+		deps, impure = frame[0], frame[1]
+		if self.frames:
+			self.frames[-1][0].update(deps)
+			if impure:
+				self.frames[-1][1] = True
+
+		if impure or self.scope_stack or any(self.is_volatile(dep) for dep in deps):
+			return None
+		return (self.serial, tuple((name, self.versions.get(name, 0)) for name in deps))
+
+	def unchanged(self, watch):
+		# none of the names read since begin_watch() have changed
+		if watch is None or watch[0] != self.serial or self.scope_stack:
+			return False
+		versions = self.versions
+		for name, version in watch[1]:
+			if versions.get(name, 0) != version:
+				return False
+		if self.frames:
+			self.frames[-1][0].update(name for name, version in watch[1])
+		return True
+
+	def impure(self):
+		# Called by functions with side effects or results that don't depend
+		# only on variables ($(shell), $(info), ...). The expansion in
+		# progress won't be cached.
+		if self.frames:
+			self.frames[-1][1] = True
+
+	def expand(self, name):
+		# the value of variable name as a string
+		frames = self.frames
+		if frames:
+			frames[-1][0].add(name)
+
+		value = self.fetch(name)
+		if not isinstance(value, Expression):
+			return value
+
+		try:
+			s, deps = self.cache[name]
+		except KeyError:
+			pass
+		else:
+			if frames:
+				frames[-1][0].update(deps)
+			return s
+
+		if name in self.expanding:
+			raise self._recursive(name)
+
+		frame = [set(), False, name]
+		frames.append(frame)
+		self.expanding.add(name)
+		try:
+			out = []
+			value.emitter()(self, out)
+		finally:
+			frames.pop()
+			self.expanding.discard(name)
+		s = "".join(out)
+
+		deps, impure = frame[0], frame[1]
+		if frames:
+			# the caller read everything we read
+			frames[-1][0].update(deps)
+			if impure:
+				frames[-1][1] = True
+
+		if not impure and not any(self.is_volatile(dep) for dep in deps):
+			logger.debug("cache expansion %s deps=%s", name, deps)
+			deps = frozenset(deps)
+			self.cache[name] = (s, deps)
+			for dep in deps:
+				self.dependents.setdefault(dep, set()).add(name)
+
+		return s
+
+	def _recursive(self, name):
+		# the error for name referencing itself; the chain comes from the
+		# expansions in progress
+		names = [frame[2] for frame in self.frames if frame[2] is not None]
+		names = names[names.index(name):] + [name]
+
+		chain = []
+		for n in names:
+			filename, pos = None, None
+			var = self.lookup(n)
+			if var is not None and isinstance(var.value, Expression):
+				filename, pos = _first_pos(var.value)
+			chain.append((n, filename, pos))
+
+		msg = "Recursive variable '{0}' references itself (eventually): {1}".format(
+				name, " -> ".join(
+					"{0} ({1}:{2})".format(n, filename, pos[0]+1) if pos else n
+						for n, filename, pos in chain))
+		logger.error(msg)
+		return RecursiveVariable(msg, chain=chain, filename=chain[0][1],
+								 pos=chain[0][2], description=msg)
+
+	def call(self, name, args):
+		# $(call name,args...); name's value expanded with $1..$N the args
+		frames = self.frames
+		if frames:
+			frames[-1][0].add(name)
+		var = self.lookup(name)
+		if var is None:
+			return ""
+		value = var.value
+		if not isinstance(value, Expression):
+			# simply expanded; there's nothing left to substitute
+			return value
+
+		# The body's reads go in a frame of their own so the $n reads can be
+		# dropped; the args came from the caller's expressions (whose reads
+		# are already in the caller's frame).
+		frame = [set(), False, None]
+		frames.append(frame)
+		self.call_frames.append((name,) + tuple(args))
+		try:
+			out = []
+			value.emitter()(self, out)
+		finally:
+			self.call_frames.pop()
+			frames.pop()
+
+		if frames:
+			deps = frame[0]
+			frames[-1][0].update(dep for dep in deps if not dep.isdigit())
+			if frame[1]:
+				frames[-1][1] = True
+		return "".join(out)
+
+	def foreach(self, name, words, body, out):
+		# $(foreach name,words,body): body is an emitter run once per word
+		# (from the iterable words) with name bound to the word, appending
+		# to out
+		name = self.names.intern(name)
+		var = Variable(name, "", ORIGIN_AUTOMATIC, FLAVOR_SIMPLE)
+
+		save = self.loop_vars.get(name)
+		was_volatile = name in self.volatile
+		self.loop_vars[name] = var
+		self.volatile.add(name)
+		# cached expansions saw the variable (if any) name hides
+		self.invalidate(name)
+
+		# name's reads are dropped from the caller's frame (like $(call)'s
+		# args)
+		frames = self.frames
+		frame = [set(), False, None]
+		frames.append(frame)
+		try:
+			sep = False
+			for word in words:
+				var._value = word
+				if sep:
+					out.append(" ")
+				body(self, out)
+				sep = True
+		finally:
+			frames.pop()
+			if save is None:
+				del self.loop_vars[name]
+			else:
+				self.loop_vars[name] = save
+			if not was_volatile:
+				self.volatile.discard(name)
+
+		if frames:
+			frames[-1][0].update(dep for dep in frame[0] if dep is not name)
+			if frame[1]:
+				frames[-1][1] = True
+
+	def arg(self, slot, name):
+		# $slot of the innermost $(call); name is str(slot)
+		if not self.call_frames:
+			# not in a $(call); a plain variable
+			return self.expand(name)
+		if self.frames:
+			self.frames[-1][0].add(name)
+		args = self.call_frames[-1]
+		return args[slot] if slot < len(args) else ""
 
 	def fetch(self, s):
 		# now try a var lookup 
@@ -26,14 +700,9 @@ class SymbolTable(object):
 		logger.debug("fetch sym=\"%s\"", s)
 		if not len(s):
 			return ""
-		try:
-			return self.symbols[s]
-		except KeyError:
+		var = self.lookup(s)
+		if var is None:
 			logger.debug("sym=%s not in symbol table", s)
-			# try environment
-			value = os.getenv(s)
-			if value is None:
-				return ""
-			logger.debug("sym=%s found in environ", s)
-			return value
+			return ""
+		return var.value
 
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# Test the on-disk parse cache.
+
+import os
+import logging
+import tempfile
+
+logger = logging.getLogger("pymake.test_cache")
+
+import pymake
+from cache import ParseCache
+
+makefile_src = """\
+CC=gcc
+CFLAGS:=-g -Wall
+$(info CC=$(CC))
+"""
+
+def write_file(filename, s):
+	with open(filename, "w") as outfile:
+		outfile.write(s)
+
+def parse_no_tokenize(infilename, cache):
+	# fail loudly if the tokenizer is run
+	def boom(src):
+		assert 0, src.name
+
+	save = pymake.parse_makefile_from_src
+	pymake.parse_makefile_from_src = boom
+	try:
+		return pymake.parse_makefile(infilename, cache)
+	finally:
+		pymake.parse_makefile_from_src = save
+
+def test1():
+	# cold parse fills the cache, warm parse skips the tokenizer
+	with tempfile.TemporaryDirectory() as tmpdir:
+		infilename = os.path.join(tmpdir, "Makefile")
+		write_file(infilename, makefile_src)
+
+		cache = ParseCache(os.path.join(tmpdir, "cache"))
+		makefile = pymake.parse_makefile(infilename, cache)
+
+		warm = parse_no_tokenize(infilename, cache)
+		assert warm.makefile()==makefile.makefile(), warm.makefile()
+
+		# positions survive the trip through the cache
+		vchar = warm.token_list[0].token_list[0].token_list[0].string[0]
+		assert vchar.filename==infilename, vchar.filename
+
+def test2():
+	# changed content is a miss
+	with tempfile.TemporaryDirectory() as tmpdir:
+		infilename = os.path.join(tmpdir, "Makefile")
+		write_file(infilename, makefile_src)
+
+		cache = ParseCache(os.path.join(tmpdir, "cache"))
+		pymake.parse_makefile(infilename, cache)
+
+		write_file(infilename, makefile_src + "LD=ld\n")
+		# make sure the mtime moves even on coarse filesystems
+		st = os.stat(infilename)
+		os.utime(infilename, ns=(st.st_atime_ns, st.st_mtime_ns+10**9))
+
+		makefile, key = cache.lookup(infilename)
+		assert makefile is None
+
+		makefile = pymake.parse_makefile(infilename, cache)
+		assert len(makefile.token_list)==4, len(makefile.token_list)
+
+def test3():
+	# touched but unchanged content is still a hit (rehashed, not reparsed)
+	with tempfile.TemporaryDirectory() as tmpdir:
+		infilename = os.path.join(tmpdir, "Makefile")
+		write_file(infilename, makefile_src)
+
+		cache = ParseCache(os.path.join(tmpdir, "cache"))
+		pymake.parse_makefile(infilename, cache)
+
+		st = os.stat(infilename)
+		os.utime(infilename, ns=(st.st_atime_ns, st.st_mtime_ns+10**9))
+
+		warm = parse_no_tokenize(infilename, cache)
+		assert len(warm.token_list)==3, len(warm.token_list)
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.DEBUG)
+	test1()
+	test2()
+	test3()
@@ -6,7 +6,10 @@
 import pymake
 from pymake import *
 from vline import VirtualLine
+from symtable import SymbolTable
+from error import EvalError
 import run_tests
+from run_tests import parse_string, eval_makefile
 
 run = run_tests.run_makefile_string
 
@@ -264,6 +267,74 @@ endif
 endif"""
 	run(s,r)
 
+def test_eval():
+	src = """\
+ifeq ($(OS),linux)
+X = linux
+else ifeq "$(OS)" 'darwin'
+X = mac
+else ifneq ($(OS), )
+X = other $(OS)
+else
+X = none
+endif
+ifdef X
+ifndef NOPE
+Y = $(X)-y
+endif
+endif
+ifeq ($(subst a,b,aa),bb)
+Z = (z)
+endif
+"""
+	makefile = parse_string(src)
+
+	def evaluate(os_name):
+		symtable = SymbolTable(environ={})
+		if os_name is not None:
+			symtable.add("OS", os_name)
+		return eval_makefile(makefile, symtable)
+
+	symtable = evaluate("linux")
+	assert symtable.fetch("Y").eval(symtable)=="linux-y"
+	assert symtable.fetch("Z")
+	assert evaluate("darwin").expand("X")=="mac"
+	assert evaluate("beos").expand("X")=="other beos"
+	assert evaluate(None).expand("X")=="none"
+
+	# the branches taken were parsed once; the rest never
+	block = makefile.token_list[0]
+	assert block.cond_blocks[0][0].is_parsed()
+	assert block.cond_blocks[3][0].is_parsed()
+
+	# same inputs, same branch; the conditions aren't evaluated again
+	symtable = evaluate("linux")
+	calls = []
+	save = IfeqDirective.is_true
+	def is_true(self, symbol_table):
+		calls.append(self)
+		return save(self, symbol_table)
+	IfeqDirective.is_true = is_true
+	try:
+		block.eval(symtable)
+		assert not calls
+		symtable.add("OS", "darwin")
+		block.eval(symtable)
+		assert calls
+		assert symtable.expand("X")=="mac"
+	finally:
+		IfeqDirective.is_true = save
+
+def test_eval_syntax():
+	for src in ("ifeq (a,b\nendif\n", "ifeq (ab)\nendif\n", "ifeq \"a\"\nendif\n"):
+		makefile = parse_string(src)
+		try:
+			makefile.token_list[0].eval(SymbolTable(environ={}))
+		except EvalError as err:
+			assert "invalid syntax in conditional" in str(err)
+		else:
+			assert 0, src
+
 if __name__=='__main__':
 	from run_tests import runlocals
 	runlocals(locals())
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
+import io
 import sys
 import logging
+import contextlib
 
 logger = logging.getLogger("pymake")
 
@@ -9,6 +11,7 @@ from symtable import SymbolTable
 import functions
 from functions import *
 from symbol import *
+from run_tests import vcs, run
 
 def test_info():
 	symbol_table = SymbolTable()
@@ -56,6 +59,112 @@ def test_split():
 		print("ok")
 	
 
+def test_eval():
+	src = """\
+T = $(M)_OBJS := $(M).o
+M = foo
+$(eval $(T))
+M = bar
+$(eval $(T))
+$(eval X := 1)
+Y = $(eval X += 2)
+"""
+	symbol_table = run(src)
+	assert symbol_table.expand("foo_OBJS")=="foo.o"
+	assert symbol_table.expand("bar_OBJS")=="bar.o"
+
+	# (the $(eval)s below parse; the tokenizer is chatty)
+	with contextlib.redirect_stdout(io.StringIO()):
+		# the same text is parsed once
+		statements = functions.parse_eval_text("X := 1")
+		assert functions.parse_eval_text("X := 1") is statements
+
+		# an expansion with an $(eval) isn't cached
+		assert symbol_table.expand("Y")==""
+		assert symbol_table.expand("Y")==""
+		assert "Y" not in symbol_table.cache
+		assert symbol_table.expand("X")=="1 2 2", symbol_table.expand("X")
+
+	# least recently used text is dropped
+	save = functions.eval_cache_size
+	functions.eval_cache_size = 2
+	try:
+		with contextlib.redirect_stdout(io.StringIO()):
+			functions.parse_eval_text("A := 1")
+			functions.parse_eval_text("B := 1")
+			functions.parse_eval_text("A := 1")
+			functions.parse_eval_text("C := 1")
+		assert list(functions._eval_cache)==["A := 1", "C := 1"]
+	finally:
+		functions.eval_cache_size = save
+
+def test_call():
+	src = """\
+pair = <$1|$(2)> $0 [$3]
+greet = hello $(call pair,$1,$2)
+X = $(call greet,a,$(B))
+B = b
+"""
+	symbol_table = run(src)
+
+	assert symbol_table.expand("X")=="hello <a|b> pair []"
+	assert symbol_table.call("greet", [" c ", "d"])=="hello < c |d> pair []"
+	assert symbol_table.call("nope", ["1"])==""
+	assert not symbol_table.call_frames
+
+	# the args are the caller's so X can be cached (and depends on B)
+	s, deps = symbol_table.cache["X"]
+	assert deps=={"greet", "pair", "B"}, deps
+	symbol_table.add("B", "bee")
+	assert symbol_table.expand("X")=="hello <a|bee> pair []"
+
+	# the macro body is compiled once
+	body = symbol_table.fetch("pair")
+	emitter = body.emitter()
+	symbol_table.call("pair", ["1", "2"])
+	assert body.emitter() is emitter
+
+	# outside a $(call), $1 is a variable like any other
+	symbol_table.add("1", "one")
+	assert VarRef([Literal(vcs("1"))]).eval(symbol_table)=="one"
+
+def test_foreach():
+	src = """\
+f = global
+G = $(f)
+SRCS = a.c b.c   c.c
+X = $(foreach f,$(SRCS),<$(f)|$(G)>)
+N = $(foreach f,1 2,$(foreach f,x y,$f)$f)
+E = [$(foreach f,,x)]
+O = $(foreach f,a b,$(origin f))
+"""
+	symbol_table = run(src)
+
+	assert symbol_table.expand("G")=="global"
+	assert symbol_table.expand("X")=="<a.c|a.c> <b.c|b.c> <c.c|c.c>"
+	assert symbol_table.expand("N")=="x y1 x y2"
+	assert symbol_table.expand("E")=="[]"
+	assert symbol_table.expand("O")=="automatic automatic"
+
+	# the loop variable hides (and doesn't disturb) the global one
+	assert symbol_table.expand("G")=="global"
+	assert not symbol_table.loop_vars
+	assert "f" not in symbol_table.volatile
+
+	# the result depends on the list, not on the loop variable
+	symbol_table.expand("N")
+	s, deps = symbol_table.cache["N"]
+	assert "f" not in deps
+
+	# 100k words without a list of them
+	words = functions.iter_words(" ".join("f%d.c" % n for n in range(100000)))
+	assert not isinstance(words, list)
+	out = []
+	body = Expression([VarRef([Literal(vcs("f"))])]).emitter()
+	symbol_table.foreach("f", words, body, out)
+	assert len(out)==199999
+	assert out[-1]=="f99999.c"
+
 def test_all():
 	test_split()
 #	test_find()
@@ -66,3 +175,6 @@ def test_all():
 if __name__=='__main__':
 	logging.basicConfig(level=logging.DEBUG)
 	test_all()
+	test_eval()
+	test_call()
+	test_foreach()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# Test the name interning table.
+
+import logging
+
+logger = logging.getLogger("pymake.test_nametable")
+
+from nametable import NameTable
+import nametable
+from symbol import *
+from symtable import SymbolTable
+from vline import VCharString
+
+def test1():
+	table = NameTable()
+
+	# build the strings at runtime so python doesn't share the constants
+	a = "".join(["CFL", "AGS"])
+	b = "".join(["CF", "LAGS"])
+	assert a is not b
+
+	assert table.intern(a) is a
+	assert table.intern(b) is a
+	assert len(table)==1
+	assert "CFLAGS" in table
+
+	n = table.id(b)
+	assert table.id(a)==n
+	assert table.name(n) is a
+	assert table.id("LDFLAGS")==n+1
+
+def test2():
+	# names from the AST and the symbol table's keys are the same objects
+	symbol_table = SymbolTable()
+	e = VarRef([Literal(VCharString.from_string("CFLAGS"))])
+	symbol_table.add("".join(["CF", "LAGS"]), "-g")
+	assert e.eval(symbol_table)=="-g"
+
+	name = nametable.names.intern("".join(["CF", "LAGS"]))
+	key = [k for k in symbol_table.symbols if k=="CFLAGS"][0]
+	assert key is name
+
+	# other text isn't interned
+	lit = Literal(VCharString.from_string("@echo some recipe text"))
+	text = lit.eval(symbol_table)
+	assert lit.eval(symbol_table) is text
+	assert text not in nametable.names
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.DEBUG)
+	test1()
+	test2()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# Test parse-time constant folding.
+
+import logging
+
+logger = logging.getLogger("pymake.test_optimize")
+
+from symbol import *
+from symtable import SymbolTable
+from optimize import optimize, optimize_makefile
+import walker
+from run_tests import vcs, parse_string
+
+def count_nodes(node):
+	return sum(1 for t in walker.iter_nodes(node))
+
+def test_merge():
+	e = Expression([Literal(vcs("foo")), Literal(vcs(" ")), VarRef([Literal(vcs("CC"))]),
+					Literal(vcs("bar")), Literal(vcs("baz"))])
+	before = e.makefile()
+	e2 = optimize(e)
+	assert e2 is not e
+	assert len(e2.token_list)==3, e2.token_list
+	assert e2.makefile()==before
+	# unchanged original
+	assert len(e.token_list)==5
+
+	# nothing to do returns the same node
+	assert optimize(e2) is e2
+
+src = """\
+CFLAGS := -g -O2
+X = $(subst a,b,aaa) $(CC)
+W := $(words a b c)
+ifeq (a,a)
+Y = 1
+endif
+"""
+
+def test_fold():
+	makefile = parse_string(src)
+	before = makefile.makefile()
+
+	optimized = optimize_makefile(makefile)
+	assert optimized is not makefile
+	# the original tree is untouched
+	assert makefile.makefile()==before
+
+	assert optimized.makefile()=="CFLAGS:=-g -O2\nX=bbb $(CC)\nW:=3\nifeq (a,a)\nY = 1\nendif", optimized.makefile()
+	assert sum(count_nodes(t) for t in optimized) < sum(count_nodes(t) for t in makefile)
+
+	# same results
+	for tok, opt in zip(makefile.token_list[:3], optimized.token_list[:3]):
+		symtable = SymbolTable()
+		symtable.add("CC", "gcc")
+		rhs = tok.token_list[2].eval(symtable)
+		assert opt.token_list[2].eval(symtable)==rhs, rhs
+
+	# folded text points at the original source
+	lit = optimized.token_list[1].token_list[2].token_list[0]
+	assert isinstance(lit, Literal)
+	assert lit.string[0].filename=="test.mk"
+	assert lit.string[0].pos[0]==1, lit.string[0].pos
+
+def test_not_folded():
+	# results Literal.eval() can't reproduce stay as function calls
+	makefile = parse_string("X = $(subst a,\\\\,aaa)\n")
+	optimized = optimize_makefile(makefile)
+	assert optimized.makefile()==makefile.makefile(), optimized.makefile()
+
+	# target lists aren't merged
+	makefile = parse_string("a b c : d\n")
+	assert optimize_makefile(makefile).token_list[0] is makefile.token_list[0]
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.DEBUG)
+	test_merge()
+	test_fold()
+	test_not_folded()
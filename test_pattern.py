@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# Test % pattern matching and $(filter)/$(filter-out).
+
+import logging
+
+logger = logging.getLogger("pymake.test_pattern")
+
+from pattern import split_pattern, PatternIndex, compile_patterns
+from run_tests import run
+
+def test_split():
+	assert split_pattern("%.c")==("", ".c")
+	assert split_pattern("lib%.a")==("lib", ".a")
+	assert split_pattern("%")==("", "")
+	assert split_pattern("foo.o") is None
+	assert split_pattern("100\\%") is None
+	assert split_pattern("\\%x%y")==("%x", "y")
+
+def test_index():
+	index = PatternIndex(["%.c", "%.h", "lib%.a", "foo", "%", "100\\%"])
+	for word in ("a.c", ".c", "b.h", "libz.a", "foo", "anything", "100%"):
+		assert index.match(word), word
+
+	index = PatternIndex(["%.c", "lib%.a", "src/%.c", "foo"])
+	assert index.match("x.c")
+	assert index.match("lib.a")
+	assert index.match("src/x.c")
+	assert not index.match("x.h")
+	assert not index.match("lib")
+	# prefix and suffix can't overlap
+	assert not PatternIndex(["ab%ba"]).match("aba")
+	assert not index.match("foo.o")
+
+	words = ["a.c", "b.h", "a.c", "foo", "libq.a"]
+	assert index.filter(words)==["a.c", "a.c", "foo", "libq.a"]
+	assert index.filter_out(words)==["b.h"]
+
+	# patterns are bucketed on their suffix; varied prefixes share a bucket
+	index = PatternIndex(["dir%d/%%.c" % n for n in range(100)] + ["%.h", "%.o"])
+	assert sorted(index.suffixes)==[".c", ".h", ".o"]
+	assert index._suffix_lengths==[2]
+	assert index.match("dir42/foo.c")
+	assert not index.match("dir100/foo.c")
+	assert index.match(".o")
+
+	assert compile_patterns(("%.c",)) is compile_patterns(("%.c",))
+
+def test_filter():
+	symbol_table = run("""\
+SRCS = a.c b.h lib/x.c c.o a.c foo libz.a
+C = $(filter %.c %.h,$(SRCS))
+NOTC = $(filter-out %.c %.h,$(SRCS))
+L = $(filter foo lib%.a,$(SRCS))
+N = $(words $(filter-out %.c,$(SRCS)))
+E = [$(filter ,$(SRCS))]
+S = $(sort $(filter %.c,$(SRCS)))
+""")
+	assert symbol_table.expand("C")=="a.c b.h lib/x.c a.c"
+	assert symbol_table.expand("NOTC")=="c.o foo libz.a"
+	assert symbol_table.expand("L")=="foo libz.a"
+	assert symbol_table.expand("N")=="4"
+	assert symbol_table.expand("E")=="[]"
+	assert symbol_table.expand("S")=="a.c lib/x.c"
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.DEBUG)
+	test_split()
+	test_index()
+	test_filter()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# Test the binary AST serialization.
+
+import os
+import logging
+import tempfile
+
+logger = logging.getLogger("pymake.test_serialize")
+
+import pymake
+from symbol import *
+from hashcons import HashConsTable
+import serialize
+import cache
+
+makefile_src = """\
+CC=gcc
+CFLAGS:=-g -Wall \\
+	-O2
+OBJ = $(patsubst %.c,%.o,$(SRC$(N)))
+$(info CC=$(CC))
+all : foo.o bar.o $(OBJ)
+foo.o : foo.h $(HDRS)
+bar.o : foo.h $(HDRS)
+"""
+
+def parse_string(s):
+	with tempfile.TemporaryDirectory() as tmpdir:
+		infilename = os.path.join(tmpdir, "Makefile")
+		with open(infilename, "w") as outfile:
+			outfile.write(s)
+		return pymake.parse_makefile(infilename)
+
+def all_vchars(tok):
+	if isinstance(tok, Expression):
+		for t in tok.token_list:
+			yield from all_vchars(t)
+	elif tok.string:
+		yield from tok.string
+
+def test1():
+	makefile = parse_string(makefile_src)
+	data = serialize.dumps(makefile)
+	makefile2 = serialize.loads(data)
+
+	assert makefile2.makefile()==makefile.makefile(), makefile2.makefile()
+	assert str(makefile2)==str(makefile)
+
+	for tok, tok2 in zip(makefile.token_list, makefile2.token_list):
+		assert tok==tok2, (tok, tok2)
+		assert hash(tok)==hash(tok2)
+		# source map survives
+		for vchar, vchar2 in zip(all_vchars(tok), all_vchars(tok2)):
+			assert vchar.char==vchar2.char
+			assert vchar.pos==vchar2.pos, (vchar.pos, vchar2.pos)
+			assert vchar.filename==vchar2.filename
+			assert vchar.hide==vchar2.hide
+
+def test_lazy():
+	makefile = serialize.loads(serialize.dumps(parse_string(makefile_src)))
+
+	rule = makefile.token_list[4]
+	assert isinstance(rule, RuleExpression)
+	# the recipe list is the same object in both places and not loaded yet
+	assert rule.recipe_list is rule.token_list[3]
+	assert isinstance(rule.recipe_list, RecipeList)
+	assert hasattr(rule.recipe_list, "_lazy")
+
+	# touching it loads it
+	assert len(rule.recipe_list)==0
+	assert not hasattr(rule.recipe_list, "_lazy")
+
+def test_shared():
+	# hash-consed subtrees stay shared
+	makefile = parse_string(makefile_src)
+	HashConsTable().intern_makefile(makefile)
+	makefile2 = serialize.loads(serialize.dumps(makefile))
+	assert makefile2.token_list[5].token_list[2] is makefile2.token_list[6].token_list[2]
+
+def test_version():
+	data = bytearray(serialize.dumps(parse_string("CC=gcc\n")))
+	data[len(serialize.magic)] += 1
+	try:
+		serialize.loads(bytes(data))
+	except ValueError:
+		pass
+	else:
+		assert 0
+
+def test_schema():
+	# data written with a different node layout (or interpreter) is refused
+	data = bytearray(serialize.dumps(parse_string("CC=gcc\n")))
+	fingerprint = serialize.schema().encode("ascii")
+	idx = data.index(fingerprint)
+	data[idx] = ord("x") if data[idx] != ord("x") else ord("y")
+	try:
+		serialize.loads(bytes(data))
+	except ValueError:
+		pass
+	else:
+		assert 0
+
+	# and has its own parse cache entries
+	assert serialize.schema() in cache.dialect()
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.DEBUG)
+	test1()
+	test_lazy()
+	test_shared()
+	test_version()
+	test_schema()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+# Test Symbol hierarchy internals.
+
+import os
+import io
+import logging
+import tempfile
+import contextlib
+
+logger = logging.getLogger("pymake.test_symbol")
+
+import pymake
+import symbol
+from symbol import *
+from vline import VirtualLine
+from symtable import SymbolTable
+from hashcons import HashConsTable
+from run_tests import vcs, parse_string, eval_makefile
+
+def test_checked():
+	# checked mode refuses a plain python string (no VChar positions)
+	save = symbol.checked
+	try:
+		symbol.checked = True
+		try:
+			Literal("foo")
+		except AttributeError:
+			pass
+		else:
+			assert 0
+
+		# fast mode doesn't look
+		symbol.checked = False
+		lit = Literal("foo")
+		e = Expression([lit, VarRef([Literal(vcs("bar"))])])
+		assert len(e)==2
+	finally:
+		symbol.checked = save
+
+
+def test_hash():
+	# structurally equal trees hash equal
+	e1 = Expression([Literal(vcs("foo")), VarRef([Literal(vcs("CC"))])])
+	e2 = Expression([Literal(vcs("foo")), VarRef([Literal(vcs("CC"))])])
+	assert e1 is not e2
+	assert hash(e1)==hash(e2)
+	assert e1==e2
+
+	# class is part of the structure
+	e3 = Expression([Literal(vcs("foo")), Expression([Literal(vcs("CC"))])])
+	assert e1!=e3
+
+	e4 = Expression([Literal(vcs("foo")), VarRef([Literal(vcs("LD"))])])
+	assert hash(e1)!=hash(e4)
+	assert e1!=e4
+
+	# still compare to python strings
+	assert AssignOp(vcs(":="))==":="
+
+def test_hash_collision():
+	# same crc, different text
+	text1, text2 = "X = 21841 824662301948\n", "X = 122403 571107047223\n"
+	b1 = LineBlock([VirtualLine([text1], 1, "test.mk")])
+	b2 = LineBlock([VirtualLine([text2], 1, "test.mk")])
+	assert hash(b1)==hash(b2)
+	assert b1!=b2
+	assert b1==LineBlock([VirtualLine([text1], 5, "other.mk")])
+
+	d1, d2 = DefineDirective("X", b1), DefineDirective("X", b2)
+	assert hash(d1)==hash(d2)
+	assert d1!=d2
+	assert d1==DefineDirective("X", b1)
+
+	def ifdef(name, block):
+		return ConditionalBlock([(IfdefDirective(Expression([Literal(vcs(name))])), [block])])
+	assert ifdef("A", b1)!=ifdef("A", b2)
+	assert ifdef("A", b1)!=ifdef("B", b1)
+	assert ifdef("A", b1)==ifdef("A", b1)
+	assert len({b1, b2})==2
+
+def test_hashcons():
+	src = """\
+a.o : common.h $(HDRS)
+b.o : common.h $(HDRS)
+CFLAGS = -g
+ifdef DEBUG
+CFLAGS += -O0
+endif
+ifdef DEBUG
+CFLAGS += -O0
+endif
+"""
+	with tempfile.TemporaryDirectory() as tmpdir:
+		infilename = os.path.join(tmpdir, "Makefile")
+		with open(infilename, "w") as outfile:
+			outfile.write(src)
+		makefile = pymake.parse_makefile(infilename)
+
+	before = makefile.makefile()
+	table = HashConsTable()
+	table.intern_makefile(makefile)
+	assert makefile.makefile()==before, makefile.makefile()
+
+	rule_a, rule_b = makefile.token_list[0], makefile.token_list[1]
+	assert rule_a is not rule_b
+	# identical prerequisite lists are now the same object
+	assert rule_a.token_list[2] is rule_b.token_list[2]
+	assert rule_a.recipe_list is rule_b.recipe_list
+	assert table.hits > 0
+
+	# a conditional's contents are shared too
+	cond1, cond2 = makefile.token_list[3], makefile.token_list[4]
+	assert cond1 is not cond2
+	assert cond1.cond_exprs[0].expression is cond2.cond_exprs[0].expression
+	assert cond1.cond_blocks[0][0] is cond2.cond_blocks[0][0]
+
+def test_index():
+	src = """\
+CFLAGS = -g
+all : a.o b.o
+a.o b.o : common.h
+ifdef DEBUG
+CFLAGS += -O0
+endif
+override CFLAGS += -Wall
+$(prefix)FLAGS = -x
+vpath %.h include
+"""
+	with tempfile.TemporaryDirectory() as tmpdir:
+		infilename = os.path.join(tmpdir, "Makefile")
+		with open(infilename, "w") as outfile:
+			outfile.write(src)
+		makefile = pymake.parse_makefile(infilename)
+
+	assert len(makefile.find(RuleExpression))==2
+	assert len(makefile.find(Directive))==4, makefile.find(Directive)
+
+	# conditional branches are indexed, taken or not
+	cflags = makefile.assignments("CFLAGS")
+	assert len(cflags)==3, cflags
+	assert cflags[1] is makefile.token_list[3].cond_blocks[0][0].statements()[0]
+	assert cflags[2] is makefile.token_list[4].expression
+	assert makefile.assignments("FLAGS")==[]
+
+	assert makefile.rules("a.o")==[makefile.token_list[2]]
+	assert makefile.rules("all")==[makefile.token_list[1]]
+	assert makefile.rules("nope")==[]
+
+	assert len(makefile.directives("ifdef"))==1
+	assert len(makefile.directives("vpath"))==1
+
+	# cached until invalidated
+	assert makefile.find(RuleExpression) is makefile.find(RuleExpression)
+	del makefile.token_list[1:3]
+	makefile.invalidate()
+	assert makefile.find(RuleExpression)==[]
+
+def test_index_eval():
+	# the answer doesn't depend on whether a branch has been evaluated
+	src = """\
+ifdef DEBUG
+CFLAGS = -g
+debug : ; @echo debug
+else
+CFLAGS = -O2
+endif
+"""
+	makefile = parse_string(src)
+	with contextlib.redirect_stdout(io.StringIO()):
+		before = list(makefile.assignments("CFLAGS"))
+		rules = list(makefile.rules("debug"))
+	assert len(before)==2, before
+	assert len(rules)==1
+
+	symbol_table = eval_makefile(makefile, SymbolTable(environ={}))
+	assert symbol_table.expand("CFLAGS")=="-O2"
+	assert makefile.assignments("CFLAGS")==before
+	assert makefile.rules("debug")==rules
+
+def test_lineblock():
+	src = """\
+ifdef FOO
+
+CFLAGS = -g \\
+	-O2
+all : ; @echo $(CFLAGS)
+endif
+"""
+	makefile = parse_string(src)
+	block = makefile.token_list[0].cond_blocks[0][0]
+	assert isinstance(block, LineBlock)
+
+	# raw text only until something asks
+	assert block.phys_lines==("CFLAGS = -g \\\n", "\t-O2\n", "all : ; @echo $(CFLAGS)\n")
+	assert block.starts==((2, 2), (4, 1)), block.starts
+	assert not block.is_parsed()
+	expect = "ifdef FOO\nCFLAGS = -g -O2\nall : ; @echo $(CFLAGS)\nendif"
+	assert makefile.makefile()==expect, makefile.makefile()
+
+	with contextlib.redirect_stdout(io.StringIO()):
+		statements = block.statements()
+	assert block.is_parsed()
+	assert block.statements() is statements
+	assert len(statements)==2, statements
+	assert isinstance(statements[0], AssignmentExpression)
+	assert isinstance(statements[1], RuleExpression)
+
+	# parsed statements are on their original lines
+	vchar = statements[1].token_list[0].token_list[0].string[0]
+	assert vchar.filename=="test.mk"
+	assert vchar.pos==(4,0), vchar.pos
+
+	# a block far down a file is parsed from its own lines (not padded out
+	# to its line number) and still lands on its original lines
+	src = "X = 1\n" * 5000 + "ifdef FOO\n\n# comment\nA = 1\nB = 2\nendif\n"
+	makefile = parse_string(src)
+	block = makefile.token_list[-1].cond_blocks[0][0]
+	assert block.first_line()==5003, block.starts
+	assert block.source_lines()==["A = 1\n", "B = 2\n"]
+	with contextlib.redirect_stdout(io.StringIO()):
+		statements = block.statements()
+	vchar = statements[1].token_list[0].token_list[0].string[0]
+	assert vchar.pos==(5004,0), vchar.pos
+
+def test_compile():
+	symtable = SymbolTable()
+	symtable.add("CC", "gcc")
+	symtable.add("DIR", "x86")
+	symtable.add("SRCx86", "arch/x86")
+	# recursively expanded
+	symtable.add("CFLAGS", Expression([Literal(vcs("-I")), VarRef([Literal(vcs("SRC")), VarRef([Literal(vcs("DIR"))])])]))
+
+	# $(CC) $(CFLAGS) -c $(SRC$(DIR))/foo.c
+	e = Expression([VarRef([Literal(vcs("CC"))]),
+					Literal(vcs(" ")),
+					VarRef([Literal(vcs("CFLAGS"))]),
+					Literal(vcs(" -c ")),
+					VarRef([Literal(vcs("SRC")), VarRef([Literal(vcs("DIR"))])]),
+					Literal(vcs("/")),
+					Literal(vcs("foo.c")),
+				  ])
+	expect = "gcc -Iarch/x86 -c arch/x86/foo.c"
+	out = []
+	e.compile()(symtable, out)
+	assert "".join(out)==expect, out
+	# chunks are joined once per variable expansion
+	assert out==["gcc", " ", "-Iarch/x86", " -c ", "arch/x86", "/foo.c"], out
+	assert e.eval(symtable)==expect
+
+	# compiled once
+	assert e.emitter() is e.emitter()
+
+	# sees later changes to the symbol table
+	symtable.add("DIR", "arm")
+	symtable.add("SRCarm", "arch/arm")
+	assert e.eval(symtable)=="gcc -Iarch/arm -c arch/arm/foo.c", e.eval(symtable)
+
+	assert Expression([]).eval(symtable)==""
+	assert Expression([Literal(vcs("a")), Literal(vcs("b"))]).eval(symtable)=="ab"
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.DEBUG)
+	test_checked()
+	test_hash()
+	test_hash_collision()
+	test_hashcons()
+	test_index()
+	test_index_eval()
+	test_lineblock()
+	test_compile()
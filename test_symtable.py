@@ -2,12 +2,15 @@
 
 # davep 20-Mar-2016 ; symbol table
 
+import os
 import sys
 import logging
 
 from symbol import *
 from functions import *
 from symtable import SymbolTable
+from error import RecursiveVariable
+from run_tests import vcs, run
 
 logger = logging.getLogger("pymake.test_symtable")
 
@@ -27,6 +30,273 @@ def test_all():
 	assert thing, "info"
 	s = thing.eval(symtable)
 	
+def test_expand():
+	symtable = SymbolTable()
+	symtable.add("OPT", "-O2")
+	symtable.add("INC", Expression([Literal(vcs("-I")), VarRef([Literal(vcs("SRC"))])]))
+	symtable.add("SRC", "src")
+	# CFLAGS = $(OPT) $(INC)
+	symtable.add("CFLAGS", Expression([VarRef([Literal(vcs("OPT"))]), Literal(vcs(" ")), VarRef([Literal(vcs("INC"))])]))
+	symtable.add("OTHER", Expression([VarRef([Literal(vcs("OPT"))])]))
+
+	ref = VarRef([Literal(vcs("CFLAGS"))])
+	assert ref.eval(symtable)=="-O2 -Isrc"
+	s, deps = symtable.cache["CFLAGS"]
+	assert s=="-O2 -Isrc"
+	# dependencies are transitive
+	assert deps=={"OPT", "INC", "SRC"}, deps
+	assert "INC" in symtable.cache
+
+	# second expansion comes from the cache
+	assert symtable.expand("CFLAGS") is s
+
+	# changing a dependency only invalidates what read it
+	symtable.expand("OTHER")
+	symtable.add("SRC", "lib")
+	assert "CFLAGS" not in symtable.cache
+	assert "INC" not in symtable.cache
+	assert "OTHER" in symtable.cache
+	assert ref.eval(symtable)=="-O2 -Ilib"
+
+	# impure functions aren't cached
+	symtable.add("NOW", Expression([Shell([Literal(vcs("echo hi"))])]))
+	symtable.add("X", Expression([VarRef([Literal(vcs("NOW"))])]))
+	assert symtable.expand("X").strip()=="hi"
+	assert "NOW" not in symtable.cache
+	assert "X" not in symtable.cache
+
+	# nor are automatic variables
+	symtable.add("Y", Expression([VarRef([Literal(vcs("@"))])]))
+	symtable.add("@", "all")
+	assert symtable.expand("Y")=="all"
+	assert "Y" not in symtable.cache
+
+def test_origin():
+	environ = { "HOME" : "/home/make", "CC" : "cc" }
+	symtable = SymbolTable(environ=environ)
+
+	assert symtable.fetch("HOME")=="/home/make"
+	assert symtable.origin("HOME")=="environment"
+	assert symtable.flavor("HOME")=="recursive"
+
+	# a snapshot; the process environment isn't consulted
+	os.environ["PYMAKE_TEST_ORIGIN"] = "1"
+	try:
+		assert symtable.fetch("PYMAKE_TEST_ORIGIN")==""
+		assert symtable.origin("PYMAKE_TEST_ORIGIN")=="undefined"
+		assert "PYMAKE_TEST_ORIGIN" in symtable.undefined
+	finally:
+		del os.environ["PYMAKE_TEST_ORIGIN"]
+
+	src = """\
+R = $(CC)
+S := y
+CC := gcc
+override O := o
+O := ignored
+X := $(origin R) $(flavor R) $(flavor S) $(origin CC) $(origin O) $(origin HOME) $(origin NOPE) $(flavor NOPE)
+"""
+	run(src, symtable)
+
+	assert symtable.fetch("O")=="o"
+	assert symtable.fetch("X")=="file recursive simple file override environment undefined undefined", symtable.fetch("X")
+
+	# defining a name takes it out of the negative cache
+	symtable.add("NOPE", "here")
+	assert symtable.fetch("NOPE")=="here"
+
+def test_scopes():
+	src = """\
+CC = gcc
+LD = ld
+FLAGS = $(CC) $(LD)
+override OPT = -O2
+specific : CC=mycc
+specific : OPT=-O0
+%.o : LD=objld
+lib%.o : LD=libld
+prog : CC=progcc
+"""
+	symtable = run(src)
+
+	# target-specific variables don't touch the global table
+	assert symtable.expand("FLAGS")=="gcc ld"
+	assert symtable.expand("OPT")=="-O2"
+
+	scope = symtable.target_scope("specific")
+	symtable.push_scope(scope)
+	assert symtable.expand("FLAGS")=="mycc ld", symtable.expand("FLAGS")
+	# override beats target-specific
+	assert symtable.expand("OPT")=="-O2"
+	symtable.pop_scope()
+	assert symtable.expand("FLAGS")=="gcc ld"
+
+	# shorter stem wins; prerequisites inherit from the target that wants them
+	prog = symtable.target_scope("prog")
+	symtable.push_scope(symtable.target_scope("libfoo.o", prog))
+	assert symtable.expand("FLAGS")=="progcc libld"
+	symtable.pop_scope()
+	symtable.push_scope(symtable.target_scope("foo.o"))
+	assert symtable.expand("FLAGS")=="gcc objld"
+
+	# a global assignment is seen inside a scope
+	symtable.add("CC", "clang")
+	assert symtable.expand("FLAGS")=="clang objld"
+	symtable.pop_scope()
+	assert symtable.expand("FLAGS")=="clang ld"
+
+	# a target without variables shares its parent's view
+	plain = symtable.target_scope("plain.c", prog)
+	assert plain.view() is prog.view()
+	assert symtable.target_scope("plain.c", prog) is plain
+
+	# automatic variables sit on top
+	auto = symtable.automatic_scope(plain, { "@" : "plain.c" })
+	symtable.push_scope(auto)
+	assert symtable.expand("@")=="plain.c"
+	assert symtable.origin("@")=="automatic"
+	assert symtable.expand("CC")=="progcc"
+	symtable.pop_scope()
+	assert symtable.expand("@")==""
+
+def test_append():
+	src = """\
+OBJS := a.o
+OBJS += b.o
+OBJS += $(EXTRA)
+R = $(X)
+R += $(Y)
+EMPTY :=
+EMPTY += e
+NEW += n
+PATH += /opt/bin
+override O := o
+O += ignored
+override O += p
+foo : R += $(Z)
+"""
+	symtable = SymbolTable(environ={ "PATH" : "/bin" })
+	symtable.add("EXTRA", "c.o")
+	symtable.add("X", "x")
+	run(src, symtable)
+
+	# simply expanded: the RHS is expanded when appended
+	symtable.add("EXTRA", "later.o")
+	assert symtable.expand("OBJS")=="a.o b.o c.o", symtable.expand("OBJS")
+	assert symtable.flavor("OBJS")=="simple"
+
+	# recursively expanded: the RHS is expanded when read
+	symtable.add("Y", "y")
+	assert symtable.expand("R")=="x y"
+	assert symtable.flavor("R")=="recursive"
+	symtable.add("Y", "why")
+	assert symtable.expand("R")=="x why"
+
+	# no leading space on an empty value
+	assert symtable.expand("EMPTY")=="e"
+	assert symtable.expand("NEW")=="n"
+	assert symtable.flavor("NEW")=="recursive"
+
+	assert symtable.expand("PATH")=="/bin /opt/bin"
+	assert symtable.origin("PATH")=="file"
+	assert symtable.lookup("PATH") is not symtable.environment["PATH"]
+
+	assert symtable.expand("O")=="o p"
+
+	symtable.add("Z", "z")
+	symtable.push_scope(symtable.target_scope("foo"))
+	assert symtable.expand("R")=="x why z"
+	symtable.pop_scope()
+	assert symtable.expand("R")=="x why"
+
+	# the joined value is cached until the next append
+	var = symtable.lookup("OBJS")
+	assert var.value is var.value
+	for n in range(1000):
+		var.append("%d.o" % n)
+	assert var.value.endswith(" 998.o 999.o")
+	assert len(var.value.split())==1003
+
+def test_append_specific():
+	# a target-specific += appends to the value inherited when it's read
+	src = """\
+CFLAGS = -g
+foo : CFLAGS += -O0
+prog : CFLAGS += -p
+foo : CFLAGS += -x
+S := s
+foo : S += $(CFLAGS)
+bar : NEW += n
+CFLAGS += -Wall
+"""
+	symtable = run(src)
+
+	foo = symtable.target_scope("foo")
+	symtable.push_scope(foo)
+	assert symtable.expand("CFLAGS")=="-g -Wall -O0 -x", symtable.expand("CFLAGS")
+	assert symtable.flavor("CFLAGS")=="recursive"
+	# appended to a simple value it's still expanded when read (and its
+	# $(CFLAGS) is foo's)
+	assert symtable.expand("S")=="s -g -Wall -O0 -x"
+	assert symtable.flavor("S")=="recursive"
+	symtable.add("CFLAGS", "-O2")
+	assert symtable.expand("CFLAGS")=="-O2 -O0 -x"
+	symtable.pop_scope()
+	assert symtable.expand("CFLAGS")=="-O2"
+
+	# a prerequisite appends to its parent target's value
+	symtable.push_scope(symtable.target_scope("foo", symtable.target_scope("prog")))
+	assert symtable.expand("CFLAGS")=="-O2 -p -O0 -x"
+	symtable.pop_scope()
+
+	# nothing inherited
+	symtable.push_scope(symtable.target_scope("bar"))
+	assert symtable.expand("NEW")=="n"
+	symtable.pop_scope()
+	assert symtable.expand("NEW")==""
+
+def test_recursive():
+	src = """\
+A = $(B) a
+B = x $(C)
+C = $(A)
+SELF = $(SELF)
+OK = $(D) $(D)
+D = d
+"""
+	symtable = run(src)
+
+	# referencing a variable twice isn't a loop
+	assert symtable.expand("OK")=="d d"
+
+	try:
+		symtable.expand("A")
+	except RecursiveVariable as err:
+		assert [name for name, filename, pos in err.chain]==["A", "B", "C", "A"], err.chain
+		assert err.chain[1]==("B", "test.mk", (1, 4)), err.chain
+		assert "Recursive variable 'A' references itself (eventually)" in str(err)
+		assert "test.mk:3" in err.description
+	else:
+		assert 0, "no error"
+
+	try:
+		VarRef([Literal(vcs("SELF"))]).eval(symtable)
+	except RecursiveVariable as err:
+		assert [name for name, filename, pos in err.chain]==["SELF", "SELF"], err.chain
+	else:
+		assert 0, "no error"
+
+	# nothing left half done
+	assert not symtable.frames and not symtable.expanding
+	symtable.add("C", "c")
+	assert symtable.expand("A")=="x c a"
+
 if __name__=='__main__':
 	logging.basicConfig(level=logging.DEBUG)
 	test_all()
+	test_expand()
+	test_origin()
+	test_scopes()
+	test_append()
+	test_append_specific()
+	test_recursive()
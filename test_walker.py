@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Test the AST walker.
+
+import os
+import io
+import logging
+import tempfile
+import contextlib
+
+logger = logging.getLogger("pymake.test_walker")
+
+import pymake
+import symbol
+from symbol import *
+import walker
+from run_tests import vcs
+
+def parse_string(s):
+	with tempfile.TemporaryDirectory() as tmpdir:
+		infilename = os.path.join(tmpdir, "Makefile")
+		with open(infilename, "w") as outfile:
+			outfile.write(s)
+		with contextlib.redirect_stdout(io.StringIO()):
+			return pymake.parse_makefile(infilename)
+
+src = """\
+CC = gcc
+all : a.o
+	$(CC) -o $@ $^
+ifdef DEBUG
+CFLAGS = -g
+else
+CFLAGS = -O2
+endif
+"""
+
+class Counter(walker.Visitor):
+	def __init__(self):
+		self.literals = []
+		self.varrefs = 0
+		self.order = []
+
+	def enter_Literal(self, node):
+		self.literals.append(str(node.string))
+
+	def enter_VarRef(self, node):
+		self.varrefs += 1
+
+	def enter_default(self, node):
+		self.order.append(("enter", node.__class__.__name__))
+
+	def leave_default(self, node):
+		self.order.append(("leave", node.__class__.__name__))
+
+def test_visitor():
+	makefile = parse_string(src)
+	counter = Counter()
+	walker.walk(makefile, counter)
+
+	assert "gcc" in counter.literals, counter.literals
+	assert counter.varrefs==3, counter.varrefs
+
+	# preorder enter, postorder leave
+	assert counter.order[0]==("enter", "Makefile")
+	assert counter.order[-1]==("leave", "Makefile")
+
+	# descended into the conditional
+	names = [name for how, name in counter.order]
+	assert "IfdefDirective" in names
+	assert names.count("LineBlock")==4, names
+
+def test_prune_fused():
+	makefile = parse_string(src)
+
+	class Statements(walker.Visitor):
+		def __init__(self):
+			self.seen = []
+		def enter_Makefile(self, node):
+			pass
+		def enter_default(self, node):
+			self.seen.append(node)
+			return walker.PRUNE
+
+	statements = Statements()
+	counter = Counter()
+	# one traversal; pruning one visitor doesn't prune the other
+	walker.walk(makefile, statements, counter)
+	assert statements.seen==makefile.token_list, statements.seen
+	assert counter.varrefs==3
+
+def test_deep():
+	# far deeper than the recursion limit
+	save = symbol.checked
+	symbol.checked = False
+	try:
+		node = Literal(vcs("x"))
+		for n in range(50000):
+			node = VarRef([node])
+	finally:
+		symbol.checked = save
+
+	count = sum(1 for t in walker.iter_nodes(node))
+	assert count==50001, count
+
+	# prune
+	count = sum(1 for t in walker.iter_nodes(node, prune=lambda t: True))
+	assert count==1
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.DEBUG)
+	test_visitor()
+	test_prune_fused()
+	test_deep()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# Test the WordList value and the text functions built on it.
+
+import logging
+
+logger = logging.getLogger("pymake.test_wordlist")
+
+from wordlist import WordList, iter_words
+import functions
+from error import EvalError
+from run_tests import run
+
+def test_wordlist():
+	words = WordList.from_string("  foo bar\tbaz\n")
+	assert len(words)==3
+	assert words[0]=="foo" and words[-1]=="baz"
+	# split once
+	assert words.words() is words.words()
+	# text given is kept as-is
+	assert str(words)=="  foo bar\tbaz\n"
+
+	words = WordList(["a", "b"])
+	assert str(words)=="a b"
+	assert str(words) is str(words)
+	assert list(words)==["a", "b"]
+
+	assert len(WordList.from_string(""))==0
+	assert list(iter_words(" x  y ")) == ["x", "y"]
+
+def test_functions():
+	symbol_table = run("""\
+L = c a b a
+S = $(sort $(L))
+N = $(words $(sort $(L)))
+F = $(firstword $(sort $(L)))
+W = $(word 2,$(L))
+W4 = [$(word 5,$(L))]
+R = $(wordlist 2,3,$(L))
+R2 = [$(wordlist 4,100,$(sort $(L)))]
+R3 = [$(wordlist 3,2,$(L))]
+""")
+	assert symbol_table.expand("S")=="a b c"
+	assert symbol_table.expand("N")=="3"
+	assert symbol_table.expand("F")=="a"
+	assert symbol_table.expand("W")=="a"
+	assert symbol_table.expand("W4")=="[]"
+	assert symbol_table.expand("R")=="a b"
+	assert symbol_table.expand("R2")=="[]"
+	assert symbol_table.expand("R3")=="[]"
+
+def test_chain():
+	# an argument that's a function call hands over its WordList
+	symbol_table = run("L = b a\nN = $(words $(sort $(L)))\n")
+	calls = []
+	save = functions.Sort.eval
+	def no_eval(self, symbol_table):
+		calls.append(self)
+		return save(self, symbol_table)
+	functions.Sort.eval = no_eval
+	try:
+		assert symbol_table.expand("N")=="2"
+	finally:
+		functions.Sort.eval = save
+	assert not calls
+
+def test_errors():
+	for src in ("X := $(word 0,a b)\n", "X := $(word x,a b)\n",
+				"X := $(wordlist 0,1,a b)\n", "X := $(wordlist 1,x,a b)\n"):
+		try:
+			run(src)
+		except EvalError as err:
+			assert "argument to" in str(err), str(err)
+		else:
+			assert 0, src
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.DEBUG)
+	test_wordlist()
+	test_functions()
+	test_chain()
+	test_errors()
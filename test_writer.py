@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Test the streaming makefile writer.
+
+import os
+import io
+import logging
+import tempfile
+import contextlib
+
+logger = logging.getLogger("pymake.test_writer")
+
+import pymake
+
+# fixtures whose regenerated text parses back to the same text
+fixtures = ( "assign.mk",
+			 "confusing-directive.mk",
+			 "counted.mk",
+			 "direct_indirect.mk",
+			 "functions.mk",
+			 "info.mk",
+			 "override.mk",
+			 "path.mk",
+			 "smallest.mk",
+			 "subst.mk",
+			 "varref.mk",
+			 "vpath.mk",
+			 "words.mk",
+		   )
+
+def parse(filename):
+	# the tokenizer is very chatty
+	with contextlib.redirect_stdout(io.StringIO()):
+		return pymake.parse_makefile(filename)
+
+def test_fragments():
+	# streamed output is byte for byte the same as makefile()
+	for filename in fixtures:
+		makefile = parse(filename)
+		outfile = io.StringIO()
+		makefile.write(outfile)
+		assert outfile.getvalue()==makefile.makefile(), filename
+
+		for tok in makefile.token_list:
+			assert "".join(tok.fragments())==tok.makefile(), filename
+
+def test_round_trip():
+	# write, reparse, write again
+	with tempfile.TemporaryDirectory() as tmpdir:
+		for filename in fixtures:
+			makefile = parse(filename)
+
+			outfilename = os.path.join(tmpdir, filename)
+			with open(outfilename, "w") as outfile:
+				makefile.write(outfile)
+
+			makefile2 = parse(outfilename)
+			assert makefile2.makefile()==makefile.makefile(), filename
+			assert len(makefile2.token_list)==len(makefile.token_list), filename
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.DEBUG)
+	test_fragments()
+	test_round_trip()
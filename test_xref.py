@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# Test the variable cross-reference index.
+
+import os
+import io
+import logging
+import tempfile
+import contextlib
+
+logger = logging.getLogger("pymake.test_xref")
+
+import pymake
+from cache import ParseCache
+from xref import XrefIndex
+
+def write_file(filename, s):
+	with open(filename, "w") as outfile:
+		outfile.write(s)
+
+def update(xref, filename):
+	with contextlib.redirect_stdout(io.StringIO()):
+		return xref.update(filename)
+
+def test1():
+	with tempfile.TemporaryDirectory() as tmpdir:
+		top = os.path.join(tmpdir, "Makefile")
+		write_file(top, "CC = gcc\nCFLAGS := -g\n$(info $(CC) $(CFLAGS))\n")
+		sub = os.path.join(tmpdir, "sub.mk")
+		write_file(sub, "CFLAGS += -Wall $(EXTRA)\n")
+
+		cache = ParseCache(os.path.join(tmpdir, "cache"))
+		xref = XrefIndex(cache=cache)
+		assert update(xref, top)
+		assert update(xref, sub)
+
+		assert xref.definitions("CC")==[(top, 0, 0)], xref.definitions("CC")
+		assert xref.references("CC")==[(top, 2, 9)], xref.references("CC")
+		assert sorted(xref.definitions("CFLAGS"))==sorted([(top, 1, 0), (sub, 0, 0)])
+		assert xref.references("EXTRA")==[(sub, 0, 18)], xref.references("EXTRA")
+		# functions aren't variables
+		assert xref.references("info")==[]
+		xref.save()
+
+		# reload; unchanged files aren't parsed again
+		save = pymake.parse_makefile
+		def boom(*args):
+			assert 0, args
+		pymake.parse_makefile = boom
+		try:
+			xref = XrefIndex(cache=cache)
+			assert not update(xref, top)
+			assert not update(xref, sub)
+			assert xref.definitions("CC")==[(top, 0, 0)]
+		finally:
+			pymake.parse_makefile = save
+
+		# changed file is reindexed
+		write_file(sub, "LD = ld\n")
+		st = os.stat(sub)
+		os.utime(sub, ns=(st.st_atime_ns, st.st_mtime_ns+10**9))
+		assert update(xref, sub)
+		assert xref.definitions("CFLAGS")==[(top, 1, 0)]
+		assert xref.definitions("LD")==[(sub, 0, 0)]
+
+def test_conditional():
+	# every branch is indexed, taken or not
+	with tempfile.TemporaryDirectory() as tmpdir:
+		top = os.path.join(tmpdir, "Makefile")
+		write_file(top, "FOO = 1\nifdef BAR\nFOO = 2\nBAZ = $(FOO)\nelse\nQUX = 3\nendif\n")
+
+		xref = XrefIndex(cache=ParseCache(os.path.join(tmpdir, "cache")))
+		assert update(xref, top)
+		assert xref.definitions("FOO")==[(top, 0, 0), (top, 2, 0)], xref.definitions("FOO")
+		assert xref.definitions("BAZ")==[(top, 3, 0)], xref.definitions("BAZ")
+		assert xref.references("FOO")==[(top, 3, 8)], xref.references("FOO")
+		assert xref.definitions("QUX")==[(top, 5, 0)], xref.definitions("QUX")
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.DEBUG)
+	test1()
+	test_conditional()
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
-__all__ = [ "Version", ]
+__all__ = [ "Version", "pymake_version" ]
+
+# version of pymake itself (not the GNU Make being emulated)
+pymake_version = "0.1"
 
 # for now, focus on 3.81 compatibility
 class Version(object):
@@ -45,6 +45,9 @@ def is_line_continuation(line):
 # using a class for the virtual char so can interchange string with VirtualLine
 # in ScannerIterator
 class VChar(object):
+	# one of these for every character in the makefile so no __dict__
+	__slots__ = ("char", "pos", "hide", "filename")
+
 	def __init__(self, char, pos, filename):
 		self.char = char
 		# VCHAR_ROW, VCHAR_COL index into pos
@@ -68,6 +71,8 @@ class VCharString(object):
 	# davep 24-Apr-2016 ;  
 	# container of VChar; quack like a Python string
 	# Symbols contain a VCharString contains VChar contains filename, position, real char
+	__slots__ = ("chars",)
+
 	def __init__(self, arg=None):
 		self.chars = list(arg) if arg else []
 		# verify we have VChar
@@ -344,12 +349,14 @@ def get_vline(filename, line_iter):
 	# can't use enumerate() because the line_iter will also be used inside
 	# parse_recipes() and the idx can change with push_back
 	for line in line_iter :
-		# line_iter.idx is the *next* line number counting from zero 
-		starting_line_number = line_iter.idx-1
-		logger.debug("get_vline line_num=%d state=%d", starting_line_number, state)
+		# line_iter.idx is the *next* line number counting from zero (plus
+		# first_line)
+		logger.debug("get_vline line_num=%d state=%d", line_iter.first_line+line_iter.idx-1, state)
 #		print("{0}".format(hexdump.dump(line), end=""))
 
 		if state==state_start : 
+			# a continued line starts on its first physical line
+			starting_line_number = line_iter.first_line + line_iter.idx-1
 			start_line_stripped = line.strip()
 
 			# ignore blank lines
@@ -0,0 +1,173 @@
+# Iterative walker for the AST.
+#
+# walk(root, *visitors) visits every node under root (a Makefile or any
+# Symbol) depth first, in source order, with an explicit stack so deep trees
+# don't hit the recursion limit. Several visitors can share one traversal.
+#
+# A visitor has enter(node) and leave(node) methods. enter() returning PRUNE
+# skips the node's children for that visitor (the other visitors still see
+# them). leave() is called for every node entered, after its children.
+#
+# Visitor is a convenience base class that dispatches enter()/leave() to
+# enter_<ClassName>()/leave_<ClassName>() methods, searching the node's MRO
+# so e.g., enter_Directive() sees every kind of directive.
+#
+# children(node) is itself driven by a table keyed on class (also searched
+# through the MRO); add_children() registers new kinds of nodes.
+#
+# Walking never parses a LineBlock. A visitor that wants every branch of
+# every conditional, taken or not, calls parse_branch() from its enter().
+
+import logging
+
+logger = logging.getLogger("pymake.walker")
+
+from symbol import *
+from error import MakeError
+
+__all__ = [ "PRUNE",
+			"Visitor",
+			"walk",
+			"iter_nodes",
+			"children",
+			"add_children",
+			"parse_branch",
+		  ]
+
+# returned by enter() to skip the children of a node
+PRUNE = object()
+
+def _expression_children(node):
+	return node.token_list
+
+def _directive_children(node):
+	return (node.expression,) if node.expression else ()
+
+def _conditional_block_children(node):
+	# ifdef expression, its blocks, else ifeq expression, its blocks, ...
+	# then the else blocks
+	kids = []
+	for expr, block_list in zip(node.cond_exprs, node.cond_blocks):
+		kids.append(expr)
+		kids.extend(block_list)
+	if len(node.cond_blocks) > len(node.cond_exprs):
+		kids.extend(node.cond_blocks[-1])
+	return kids
+
+def _define_children(node):
+	return (node.line_block,)
+
+def _line_block_children(node):
+	# only blocks already parsed; walking never forces a parse (dead
+	# branches are often junk)
+	return node.statements() if node.is_parsed() else ()
+
+def _no_children(node):
+	return ()
+
+def _makefile_children(node):
+	return node.token_list
+
+# class -> function returning a node's children
+_children_table = {
+	Expression : _expression_children,
+	Directive : _directive_children,
+	ConditionalBlock : _conditional_block_children,
+	DefineDirective : _define_children,
+	LineBlock : _line_block_children,
+	Symbol : _no_children,
+	Makefile : _makefile_children,
+}
+
+# node class -> resolved function (so the MRO is searched once per class)
+_children_cache = {}
+
+def add_children(cls, fn):
+	# register fn(node) as the children of cls (and its subclasses)
+	_children_table[cls] = fn
+	_children_cache.clear()
+
+def parse_branch(node):
+	# Parse LineBlock node so its statements are walked. Returns False if
+	# it doesn't parse (branches never taken can hold anything).
+	try:
+		node.statements()
+	except MakeError as err:
+		logger.debug("can't parse LineBlock filename=%s err=%s", node.filename, err)
+		return False
+	return True
+
+def children(node):
+	cls = node.__class__
+	try:
+		fn = _children_cache[cls]
+	except KeyError:
+		fn = _no_children
+		for klass in cls.__mro__:
+			if klass in _children_table:
+				fn = _children_table[klass]
+				break
+		_children_cache[cls] = fn
+	return fn(node)
+
+class Visitor(object):
+	# Subclasses define enter_<ClassName>(node) and/or leave_<ClassName>(node).
+	# Nodes without a matching method go to enter_default()/leave_default().
+
+	def enter(self, node):
+		return self._dispatch("enter_", node)(node)
+
+	def leave(self, node):
+		return self._dispatch("leave_", node)(node)
+
+	def enter_default(self, node):
+		return None
+
+	def leave_default(self, node):
+		return None
+
+	def _dispatch(self, prefix, node):
+		# (visitor class, prefix, node class) -> method name
+		cls = self.__class__
+		key = (cls, prefix, node.__class__)
+		try:
+			name = _dispatch_cache[key]
+		except KeyError:
+			name = prefix + "default"
+			for klass in node.__class__.__mro__:
+				if hasattr(cls, prefix + klass.__name__):
+					name = prefix + klass.__name__
+					break
+			_dispatch_cache[key] = name
+		return getattr(self, name)
+
+_dispatch_cache = {}
+
+def walk(root, *visitors):
+	# Each stack entry is (node, visitors that descend into node, leaving).
+	stack = [(root, visitors, False)]
+	while stack:
+		node, active, leaving = stack.pop()
+		if leaving:
+			for v in active:
+				v.leave(node)
+			continue
+
+		descend = tuple(v for v in active if v.enter(node) is not PRUNE)
+
+		# leave() is called on every visitor that entered
+		stack.append((node, active, True))
+		if descend:
+			kids = children(node)
+			for kid in reversed(kids):
+				stack.append((kid, descend, False))
+
+def iter_nodes(root, prune=None):
+	# Yield every node under root in preorder. prune(node) returning true
+	# skips that node's children.
+	stack = [root]
+	while stack:
+		node = stack.pop()
+		yield node
+		if prune is None or not prune(node):
+			stack.extend(reversed(children(node)))
@@ -0,0 +1,62 @@
+# Whitespace separated list of words.
+#
+# The text functions ($(words), $(sort), $(firstword), $(filter), ...) all
+# work on lists of words. A WordList holds either the text or the words (or
+# both) and makes the other on first use, so a chain like
+# $(words $(sort $(filter %.c,$(SRCS)))) splits $(SRCS) once and never joins
+# the intermediate lists back into strings (see functions.arg_words()).
+
+import re
+import logging
+
+logger = logging.getLogger("pymake.wordlist")
+
+__all__ = [ "WordList",
+			"iter_words",
+		  ]
+
+_word_re = re.compile(r"\S+")
+
+def iter_words(s):
+	# the words of s, one at a time (no list of all of them)
+	for m in _word_re.finditer(s):
+		yield m.group()
+
+class WordList(object):
+	__slots__ = ("_words", "_text")
+
+	def __init__(self, words=None, text=None):
+		# words - a tuple (or list) of words without whitespace
+		# text - a string of whitespace separated words
+		assert words is not None or text is not None
+		self._words = tuple(words) if words is not None else None
+		self._text = text
+
+	@classmethod
+	def from_string(cls, s):
+		return cls(text=s)
+
+	def words(self):
+		# the words as a tuple; split once
+		if self._words is None:
+			self._words = tuple(_word_re.findall(self._text))
+		return self._words
+
+	def __str__(self):
+		# the words joined by single spaces; joined once. (Text given to the
+		# constructor is returned as-is.)
+		if self._text is None:
+			self._text = " ".join(self._words)
+		return self._text
+
+	def __len__(self):
+		return len(self.words())
+
+	def __iter__(self):
+		return iter(self.words())
+
+	def __getitem__(self, idx):
+		return self.words()[idx]
+
+	def __repr__(self):
+		return "WordList({0})".format(self.words())
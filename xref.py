@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+# Cross-reference index of variables: where is FOO assigned, where is FOO
+# referenced.
+#
+# Every AssignmentExpression with a static LHS is a definition; every VarRef
+# with a static name is a use. Positions come from the VChars so are
+# (filename, row, col) with row/col 0-based like VChar.pos.
+#
+# The index is stored on disk as json, one record per makefile keyed by the
+# same content key as the parse cache (see cache.py). update() only reparses
+# files whose content changed (and the parse itself goes through the parse
+# cache).
+#
+# usage: xref.py name makefile [makefile...]
+
+import os
+import sys
+import json
+import logging
+
+logger = logging.getLogger("pymake.xref")
+
+from symbol import *
+import walker
+from vline import VCharString
+from cache import ParseCache, dialect
+from error import ParseError
+
+__all__ = [ "XrefIndex", ]
+
+def first_pos(node):
+	# filename, row, col of the first visible char under node
+	for t in walker.iter_nodes(node):
+		if isinstance(t, Expression) or not isinstance(t.string, VCharString):
+			continue
+		for vchar in t.string:
+			if not vchar.hide:
+				return vchar.filename, vchar.pos[0], vchar.pos[1]
+	return None
+
+class Scanner(walker.Visitor):
+	# collect definitions and uses from one parsed makefile
+	def __init__(self):
+		# name -> [ [row, col], ... ]
+		self.defs = {}
+		self.uses = {}
+
+	def _add(self, table, name, node):
+		pos = first_pos(node)
+		if pos is None:
+			return
+		table.setdefault(name, []).append(list(pos[1:]))
+
+	def enter_AssignmentExpression(self, node):
+		lhs = node.token_list[0]
+		name = static_name(lhs)
+		if name:
+			self._add(self.defs, name, lhs)
+
+	def enter_VarRef(self, node):
+		name = static_name(node)
+		if name:
+			self._add(self.uses, name, node)
+
+	def enter_LineBlock(self, node):
+		# every branch, taken or not
+		if not walker.parse_branch(node):
+			return walker.PRUNE
+
+	def enter_Function(self, node):
+		# $(info ...) etc aren't variable references (their arguments are
+		# still walked)
+		pass
+
+class XrefIndex(object):
+	def __init__(self, index_filename=None, cache=None):
+		self.cache = cache if cache else ParseCache()
+		self.index_filename = index_filename if index_filename else \
+				os.path.join(self.cache.cache_dir, "xref.json")
+
+		# abspath -> { "key" : content key, "defs" : {...}, "uses" : {...} }
+		self.files = {}
+		self.dirty = False
+
+		# name -> [ (filename, row, col), ... ] built on first query
+		self._defs = None
+		self._uses = None
+
+		self.load()
+
+	def load(self):
+		try:
+			with open(self.index_filename, "r") as infile:
+				data = json.load(infile)
+		except (OSError, ValueError):
+			return
+		if data.get("dialect") != dialect():
+			# made by a different pymake; start over
+			logger.debug("xref dialect mismatch %s", self.index_filename)
+			return
+		self.files = data["files"]
+
+	def save(self):
+		if not self.dirty:
+			return
+		data = { "dialect" : dialect(),
+				 "files" : self.files }
+		self.cache.write(self.index_filename, json.dumps(data).encode("utf8"))
+		self.dirty = False
+
+	def update(self, filename):
+		# (re)index filename if its content changed; returns True if it did
+		import pymake
+
+		path = os.path.abspath(filename)
+		key = self.cache.file_key(filename)
+		record = self.files.get(path)
+		if record and record["key"]==key:
+			return False
+
+		logger.debug("xref index filename=%s key=%s", filename, key)
+		try:
+			makefile = pymake.parse_makefile(filename, self.cache)
+		except ParseError as err:
+			logger.warning("xref can't parse filename=%s err=%s", filename, err)
+			self.forget(filename)
+			return False
+
+		scanner = Scanner()
+		walker.walk(makefile, scanner)
+		self.files[path] = { "key" : key,
+							 "filename" : filename,
+							 "defs" : scanner.defs,
+							 "uses" : scanner.uses }
+		self.dirty = True
+		self._defs = self._uses = None
+		return True
+
+	def forget(self, filename):
+		if self.files.pop(os.path.abspath(filename), None) is not None:
+			self.dirty = True
+			self._defs = self._uses = None
+
+	def _build(self):
+		self._defs = {}
+		self._uses = {}
+		for record in self.files.values():
+			filename = record["filename"]
+			for table, out in ((record["defs"], self._defs), (record["uses"], self._uses)):
+				for name, positions in table.items():
+					out.setdefault(name, []).extend((filename, row, col) for row, col in positions)
+
+	def definitions(self, name):
+		if self._defs is None:
+			self._build()
+		return self._defs.get(name, [])
+
+	def references(self, name):
+		if self._uses is None:
+			self._build()
+		return self._uses.get(name, [])
+
+def usage():
+	print("usage: xref.py name makefile [makefile...]", file=sys.stderr)
+
+if __name__=='__main__':
+	logging.basicConfig(level=logging.INFO)
+
+	if len(sys.argv) < 3:
+		usage()
+		sys.exit(1)
+
+	import io
+	import contextlib
+
+	name = sys.argv[1]
+	xref = XrefIndex()
+	for filename in sys.argv[2:]:
+		# the tokenizer is very chatty
+		with contextlib.redirect_stdout(io.StringIO()):
+			xref.update(filename)
+	xref.save()
+
+	for filename, row, col in xref.definitions(name):
+		print("{0}:{1}:{2}: def {3}".format(filename, row+1, col, name))
+	for filename, row, col in xref.references(name):
+		print("{0}:{1}:{2}: use {3}".format(filename, row+1, col, name))